@@ -53,9 +53,44 @@ def create_app(config_class=Config):
     app.register_blueprint(errors_bp)
     app.register_blueprint(api_bp, url_prefix="/api/v1")
 
-    # Initialize and start the scheduler for background tasks
+    # Initialize the renderer caching the compiled email templates
+    from app.rendering import renderer
+
+    renderer.init_app(app)
+
+    # Initialize the pool of SMTP connections and the send-rate governor used to send emails
+    from app.email import send_governor, smtp_pool
+
+    smtp_pool.init_app(app)
+    send_governor.init_app(app)
+
+    # Initialize the SMS channel and its provider
+    from app.sms import sms_channel
+
+    sms_channel.init_app(app)
+
+    # Initialize the thread pool and the priority lanes sending the emails
+    from app.delivery.executor import delivery_executor
+
+    delivery_executor.init_app(app)
+
+    # Initialize the asyncio delivery engine, its event loop is only started on first use
+    from app.delivery.engines import asyncio_engine
+
+    asyncio_engine.init_app(app)
+
+    # Register the delivery engine commands
+    from app.delivery.cli import delivery_cli
+
+    app.cli.add_command(delivery_cli)
+
+    # Initialize the scheduler for background tasks, it is only started in the process
+    # elected as the scheduler leader
     scheduler.init_app(app)
-    scheduler.start()
+
+    from app.delivery.leader import leader_election
+
+    leader_election.init_app(app)
 
     return app
 
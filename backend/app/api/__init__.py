@@ -3,7 +3,7 @@ __init__.py
 
 This file initializes the API Blueprint and defines routes for health checks.
 It also imports and registers other API-related modules such as authentication,
-delivery_histories, errors, occasions, and users.
+delivery, delivery_histories, errors, occasions, and users.
 """
 
 from flask import Blueprint
@@ -25,4 +25,4 @@ def health_check():
 
 
 # Import and register other API modules
-from app.api import auth, delivery_histories, errors, occasions, users
+from app.api import auth, delivery, delivery_histories, errors, occasions, users
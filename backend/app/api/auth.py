@@ -20,6 +20,7 @@ import sqlalchemy as sa
 from app import db
 from app.api import bp
 from app.api.errors import bad_request, error_response
+from app.delivery.executor import LaneFull
 from app.email import send_password_reset_email
 from app.models import User
 from flask import request
@@ -205,6 +206,17 @@ def reset_password():
                   type: string
                 message:
                   type: string
+      503:
+        description: Service unavailable, too many emails are waiting to be sent.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
     """
 
     data = request.get_json()
@@ -218,7 +230,13 @@ def reset_password():
         return error_response(404, "Not found")
 
     token = create_access_token(identity=user)
-    send_password_reset_email(token=token, user=user)
+
+    try:
+        send_password_reset_email(token=token, user=user)
+    except LaneFull:
+        return error_response(
+            503, "too many emails are waiting to be sent, please try again later"
+        )
 
     return {}, 204
 
@@ -0,0 +1,198 @@
+"""
+delivery.py
+
+This file defines the API routes related to the delivery engine of the Memorable Messages Web Application.
+It includes functionality to retrieve the metrics of the delivery engine and to inspect and redrive
+the deliveries that failed too many times, accessible only to admin users.
+
+Routes:
+- /delivery/metrics: Endpoint to retrieve the delivery engine metrics of the serving process.
+- /delivery/dead-letters: Endpoint to retrieve the deliveries that failed too many times.
+- /delivery/dead-letters/redrive: Endpoint to put dead-lettered deliveries back in the queue.
+"""
+
+import sqlalchemy as sa
+from app import db
+from app.api import bp
+from app.api.errors import bad_request, error_response
+from app.delivery.metrics import metrics
+from app.events import redrive
+from app.models import DeadLetter
+from flask import request
+from flask_jwt_extended import current_user, jwt_required
+
+
+@bp.route("/delivery/metrics", methods=["GET"])
+@jwt_required()
+def delivery_metrics():
+    """
+    Get the delivery engine metrics.
+
+    This endpoint returns the counters, timings and gauges of the delivery engine of the process serving the request.
+
+    ---
+    tags:
+      - Delivery
+    responses:
+      200:
+        description: A successful response with the delivery engine metrics.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                counters:
+                  type: object
+                timings:
+                  type: object
+                gauges:
+                  type: object
+      401:
+        description: Unauthorized.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+    security:
+      - JWT: []
+    """
+
+    if current_user.is_admin:
+        return metrics.snapshot()
+
+    return error_response(
+        401, "you do not have the necessary authorization for this action/resource"
+    )
+
+
+@bp.route("/delivery/dead-letters", methods=["GET"])
+@jwt_required()
+def dead_letters():
+    """
+    Get all dead letters.
+
+    This endpoint returns the deliveries that failed DELIVERY_MAX_ATTEMPTS times and are no longer retried.
+
+    ---
+    tags:
+      - Delivery
+    responses:
+      200:
+        description: A successful response with the list of dead letters.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                dead_letters:
+                  type: array
+                  items:
+                    type: object
+      401:
+        description: Unauthorized.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+    security:
+      - JWT: []
+    """
+
+    if current_user.is_admin:
+        dead_letters = db.session.scalars(
+            sa.select(DeadLetter).order_by(DeadLetter.id)
+        ).all()
+
+        return {"dead_letters": [dead_letter.to_dict() for dead_letter in dead_letters]}
+
+    return error_response(
+        401, "you do not have the necessary authorization for this action/resource"
+    )
+
+
+@bp.route("/delivery/dead-letters/redrive", methods=["POST"])
+@jwt_required()
+def redrive_dead_letters():
+    """
+    Redrive dead letters.
+
+    This endpoint puts the given dead letters, or all of them if no ids are given, back in the delivery queue to be sent right away.
+
+    ---
+    tags:
+      - Delivery
+    parameters:
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+    responses:
+      200:
+        description: A successful response with the number of occasions put back in the queue.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                redriven:
+                  type: integer
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+      401:
+        description: Unauthorized.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+    security:
+      - JWT: []
+    """
+
+    if current_user.is_admin:
+        data = request.get_json(silent=True) or {}
+        ids = data.get("ids")
+
+        if ids is not None and (
+            not isinstance(ids, list)
+            or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids)
+        ):
+            return bad_request("ids must be a list of dead letter ids")
+
+        redriven = redrive(ids)
+        db.session.commit()
+
+        return {"redriven": redriven}
+
+    return error_response(
+        401, "you do not have the necessary authorization for this action/resource"
+    )
@@ -2,16 +2,18 @@
 delivery_histories.py
 
 This file defines the API routes related to delivery histories for the Memorable Messages Web Application.
-It includes functionality to retrieve all delivery histories, accessible only to admin users.
+It includes functionality to retrieve filtered pages of the delivery histories, accessible only to admin users.
 
 Routes:
-- /delivery-histories: Endpoint to retrieve all delivery histories.
+- /delivery-histories: Endpoint to retrieve a page of the delivery histories.
+- /delivery-histories/export: Endpoint to stream the delivery histories as NDJSON or CSV.
 """
 
 import sqlalchemy as sa
-from app import db
 from app.api import bp
 from app.api.errors import bad_request, error_response
+from app.api.export import stream_export
+from app.api.pagination import get_page_args, paginate, parse_datetime_arg
 from app.models import DeliveryHistory, Occasion
 from flask import request
 from flask_jwt_extended import current_user, jwt_required
@@ -23,14 +25,47 @@ def delivery_histories():
     """
     Get all delivery histories.
 
-    This endpoint returns a list of all the delivery histories.
+    This endpoint returns a page of the delivery histories, ordered by timestamp.
 
     ---
     tags:
       - Delivery Histories
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: The maximum number of delivery histories to return, up to API_MAX_PAGE_SIZE.
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: The next_cursor returned with the previous page.
+      - name: since
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only return the delivery histories recorded at or after this time.
+      - name: until
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only return the delivery histories recorded before this time.
+      - name: status
+        in: query
+        type: string
+        required: false
+        description: Only return the delivery histories with this status (e.g., DELIVERED, FAILED).
+      - name: occasion_id
+        in: query
+        type: integer
+        required: false
+        description: Only return the delivery histories of this occasion.
     responses:
       200:
-        description: A successful response with the list of delivery histories.
+        description: A successful response with a page of delivery histories.
         content:
           application/json:
             schema:
@@ -40,6 +75,20 @@ def delivery_histories():
                   type: array
                   items:
                     type: object
+                next_cursor:
+                  type: string
+                  nullable: true
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
       401:
         description: Unauthorized.
         content:
@@ -56,14 +105,163 @@ def delivery_histories():
     """
 
     if current_user.is_admin:
-        delivery_histories = db.session.scalars(sa.select(DeliveryHistory)).all()
+        try:
+            query = sa.select(DeliveryHistory).where(
+                *delivery_history_filters(request.args)
+            )
+            limit, cursor = get_page_args()
+            delivery_histories, next_cursor = paginate(
+                query, [DeliveryHistory.timestamp, DeliveryHistory.id], limit, cursor
+            )
+        except ValueError as error:
+            return bad_request(str(error))
 
         return {
             "delivery_histories": [
                 delivery_history.to_dict() for delivery_history in delivery_histories
-            ]
+            ],
+            "next_cursor": next_cursor,
         }
 
     return error_response(
         401, "you do not have the necessary authorization for this action/resource"
     )
+
+
+@bp.route("/delivery-histories/export", methods=["GET"])
+@jwt_required()
+def export_delivery_histories():
+    """
+    Export the delivery histories.
+
+    This endpoint streams the delivery histories, ordered by timestamp, as NDJSON or CSV.
+    It accepts the filters of GET /delivery-histories.
+
+    ---
+    tags:
+      - Delivery Histories
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [ndjson, csv]
+        required: false
+        description: The format of the export, ndjson by default.
+      - name: since
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only export the delivery histories recorded at or after this time.
+      - name: until
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only export the delivery histories recorded before this time.
+      - name: status
+        in: query
+        type: string
+        required: false
+        description: Only export the delivery histories with this status (e.g., DELIVERED, FAILED).
+      - name: occasion_id
+        in: query
+        type: integer
+        required: false
+        description: Only export the delivery histories of this occasion.
+    responses:
+      200:
+        description: A streamed export of the delivery histories.
+        content:
+          application/x-ndjson:
+            schema:
+              type: string
+          text/csv:
+            schema:
+              type: string
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+      401:
+        description: Unauthorized.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+    security:
+      - JWT: []
+    """
+
+    if current_user.is_admin:
+        try:
+            query = (
+                sa.select(
+                    DeliveryHistory.id,
+                    DeliveryHistory.occasion_id,
+                    DeliveryHistory.status,
+                    DeliveryHistory.attempt,
+                    DeliveryHistory.timestamp,
+                )
+                .where(*delivery_history_filters(request.args))
+                .order_by(DeliveryHistory.timestamp, DeliveryHistory.id)
+            )
+
+            return stream_export(
+                query, request.args.get("format", "ndjson"), "delivery_histories"
+            )
+        except ValueError as error:
+            return bad_request(str(error))
+
+    return error_response(
+        401, "you do not have the necessary authorization for this action/resource"
+    )
+
+
+def delivery_history_filters(args):
+    """
+    Build the conditions of the filters of GET /delivery-histories.
+
+    Args:
+    - args: The query parameters of the request.
+
+    Returns:
+    - conditions: The WHERE conditions of the query.
+
+    Raises:
+    - ValueError: If a filter value is invalid.
+    """
+
+    conditions = []
+
+    if "since" in args:
+        conditions.append(
+            DeliveryHistory.timestamp >= parse_datetime_arg(args, "since")
+        )
+
+    if "until" in args:
+        conditions.append(DeliveryHistory.timestamp < parse_datetime_arg(args, "until"))
+
+    if "status" in args:
+        conditions.append(DeliveryHistory.status == args["status"].upper())
+
+    if "occasion_id" in args:
+        try:
+            occasion_id = int(args["occasion_id"])
+        except ValueError as error:
+            raise ValueError("occasion_id must be an integer") from error
+        conditions.append(DeliveryHistory.occasion_id == occasion_id)
+
+    return conditions
@@ -0,0 +1,91 @@
+"""
+export.py
+
+This file contains the streaming exports used by the API routes dumping whole tables.
+Rows are read through a server-side cursor, API_EXPORT_CHUNK_SIZE at a time, and every
+chunk is encoded and written to the response as soon as it is read, so memory use stays
+flat whatever the size of the table and the first bytes leave right after the first chunk.
+
+Two formats are supported: NDJSON, one JSON object per line, and CSV with a header row.
+Dates and times are written in ISO 8601 in both.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from app import db
+from flask import Response, current_app, stream_with_context
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def encode_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_chunks(result):
+    for rows in result.partitions():
+        yield "".join(
+            json.dumps(
+                {key: encode_value(value) for key, value in row._mapping.items()}
+            )
+            + "\n"
+            for row in rows
+        )
+
+
+def csv_chunks(result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+
+    for rows in result.partitions():
+        writer.writerows([encode_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Exports without rows still get their header
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_export(query, export_format, filename):
+    """
+    Stream the rows of a query as an NDJSON or CSV attachment.
+
+    Args:
+    - query: The select statement of the columns to export, with its order.
+    - export_format: The format of the export, "ndjson" or "csv".
+    - filename: The name of the downloaded file, without extension.
+
+    Returns:
+    - response: A streamed Flask response.
+
+    Raises:
+    - ValueError: If the format is not supported.
+    """
+
+    if export_format not in FORMATS:
+        raise ValueError("format must be ndjson or csv")
+
+    chunk_size = current_app.config["API_EXPORT_CHUNK_SIZE"]
+    encode = ndjson_chunks if export_format == "ndjson" else csv_chunks
+
+    def generate():
+        # The query only runs once the response starts streaming
+        result = db.session.execute(query.execution_options(yield_per=chunk_size))
+        yield from encode(result)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=FORMATS[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{export_format}"'
+        },
+    )
@@ -6,7 +6,8 @@ It includes endpoints for retrieving, creating, updating, and deleting occasions
 as well as retrieving delivery histories associated with occasions.
 
 Routes:
-- /occasions: Retrieve a list of all user-created occasions.
+- /occasions: Retrieve a page of all user-created occasions.
+- /occasions/export: Stream all user-created occasions as NDJSON or CSV.
 - /occasions/<int:id>: Retrieve details of a specific occasion by ID.
 - /occasions/<int:id>: Delete a specific occasion by ID.
 - /occasions/<int:id>: Update details of a specific occasion by ID.
@@ -23,6 +24,8 @@ import sqlalchemy as sa
 from app import db
 from app.api import bp
 from app.api.errors import bad_request, error_response
+from app.api.export import stream_export
+from app.api.pagination import get_page_args, paginate, parse_fields_arg
 from app.email import schedule_email
 from app.models import DeliveryHistory, Occasion
 from flask import request
@@ -35,14 +38,30 @@ def get_occasions():
     """
     Get all occasions.
 
-    This endpoint returns a list of all the user created occasions.
+    This endpoint returns a page of the user created occasions, ordered by id.
 
     ---
     tags:
       - Occasions
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: The maximum number of occasions to return, up to API_MAX_PAGE_SIZE.
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: The next_cursor returned with the previous page.
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated list of the fields to return (e.g., id,occasion_type,date_time).
     responses:
       200:
-        description: A successful response with a list of occasions.
+        description: A successful response with a page of occasions.
         content:
           application/json:
             schema:
@@ -52,6 +71,20 @@ def get_occasions():
                   type: array
                   items:
                     type: object
+                next_cursor:
+                  type: string
+                  nullable: true
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
       401:
         description: Unauthorized.
         content:
@@ -68,12 +101,21 @@ def get_occasions():
     """
 
     if current_user.is_admin:
-        occasions = db.session.scalars(sa.select(Occasion)).all()
+        try:
+            limit, cursor = get_page_args()
+            fields = parse_fields_arg(request.args, Occasion.FIELDS, Occasion.FIELDS)
+            occasions, next_cursor = paginate(
+                sa.select(Occasion).options(Occasion.load_only(fields)),
+                [Occasion.id],
+                limit,
+                cursor,
+            )
+        except ValueError as error:
+            return bad_request(str(error))
 
         return {
-            "occasions": [
-                occasion.to_dict(include_message_content=True) for occasion in occasions
-            ]
+            "occasions": [occasion.to_dict(fields=fields) for occasion in occasions],
+            "next_cursor": next_cursor,
         }
 
     return error_response(
@@ -81,6 +123,86 @@ def get_occasions():
     )
 
 
+@bp.route("/occasions/export", methods=["GET"])
+@jwt_required()
+def export_occasions():
+    """
+    Export all occasions.
+
+    This endpoint streams every user created occasion, ordered by id, as NDJSON or CSV.
+
+    ---
+    tags:
+      - Occasions
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [ndjson, csv]
+        required: false
+        description: The format of the export, ndjson by default.
+    responses:
+      200:
+        description: A streamed export of the occasions.
+        content:
+          application/x-ndjson:
+            schema:
+              type: string
+          text/csv:
+            schema:
+              type: string
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+      401:
+        description: Unauthorized.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
+    security:
+      - JWT: []
+    """
+
+    if current_user.is_admin:
+        query = sa.select(
+            Occasion.id,
+            Occasion.user_id,
+            Occasion.delivery_method,
+            Occasion.occasion_type,
+            Occasion.is_repeated,
+            Occasion.date_time,
+            Occasion.receiver_email,
+            Occasion.receiver_phone,
+            Occasion.created_at,
+            Occasion.message_content,
+        ).order_by(Occasion.id)
+
+        try:
+            return stream_export(
+                query, request.args.get("format", "ndjson"), "occasions"
+            )
+        except ValueError as error:
+            return bad_request(str(error))
+
+    return error_response(
+        401, "you do not have the necessary authorization for this action/resource"
+    )
+
+
 @bp.route("/occasions/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_occasion(id):
@@ -158,6 +280,11 @@ def get_occasion(id):
         type: string
         required: true
         description: The id of the occasion.
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated list of the fields to return (e.g., id,occasion_type,date_time).
     responses:
       200:
         description: A successful response with the occasion details.
@@ -168,6 +295,17 @@ def get_occasion(id):
               properties:
                 occasion:
                   type: object
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
       401:
         description: Unauthorized.
         content:
@@ -194,10 +332,18 @@ def get_occasion(id):
       - JWT: []
     """
 
-    occasion = db.get_or_404(Occasion, id)
+    try:
+        fields = parse_fields_arg(request.args, Occasion.FIELDS, Occasion.FIELDS)
+    except ValueError as error:
+        return bad_request(str(error))
+
+    # The owner is needed for the authorization check whatever the fields
+    occasion = db.get_or_404(
+        Occasion, id, options=[Occasion.load_only(fields + ("user_id",))]
+    )
 
     if occasion.user_id == current_user.id or current_user.is_admin:
-        return {"occasion": occasion.to_dict(include_message_content=True)}
+        return {"occasion": occasion.to_dict(fields=fields)}
 
     return error_response(
         401, "you do not have the necessary authorization for this action/resource"
@@ -296,10 +442,9 @@ def update_occasion(id):
                 or data["delivery_method"].lower() == "sms"
             ):
                 occasion.from_dict(data)
-                db.session.commit()
+                schedule_email(occasion=occasion, action="UPDATE")
 
-                if occasion.delivery_method.lower() == "email":
-                    schedule_email(occasion=occasion, action="UPDATE")
+                db.session.commit()
 
                 return {"occasion": occasion.to_dict(include_message_content=True)}
             else:
@@ -0,0 +1,206 @@
+"""
+pagination.py
+
+This file contains the keyset pagination used by the API routes returning large lists.
+A page is selected with a WHERE clause on the sort key instead of an OFFSET, so the
+database seeks straight to the first row of the page through the index of the key and
+page N costs the same as page 1.
+
+Clients pass the limit query parameter for the page size and the cursor query parameter
+with the next_cursor returned with the previous page. Cursors are opaque: they are the
+sort key of the last row of the page, encoded as URL-safe base64 JSON. The filters of the
+paginated routes are parsed with parse_datetime_arg and parse_bool_arg, and the fields
+query parameter selecting the fields of the returned objects with parse_fields_arg.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from app import db
+from flask import current_app, request
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key of a row as an opaque cursor.
+
+    Args:
+    - values: The values of the sort key columns.
+
+    Returns:
+    - cursor: The cursor string.
+    """
+
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a cursor back into the sort key of a row.
+
+    Args:
+    - cursor: The cursor string.
+    - columns: The sort key columns.
+
+    Returns:
+    - values: The values of the sort key columns.
+
+    Raises:
+    - ValueError: If the cursor was not returned for these columns.
+    """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise ValueError("invalid cursor") from error
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("invalid cursor")
+
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+
+        if python_type is datetime and isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError as error:
+                raise ValueError("invalid cursor") from error
+
+        if not isinstance(value, python_type) or isinstance(value, bool):
+            raise ValueError("invalid cursor")
+
+        decoded.append(value)
+
+    return decoded
+
+
+def get_page_args():
+    """
+    Read the limit and cursor query parameters of the request.
+
+    Returns:
+    - page: A (limit, cursor) tuple, cursor is None for the first page.
+
+    Raises:
+    - ValueError: If limit is not a positive integer.
+    """
+
+    config = current_app.config
+    limit = request.args.get("limit", config["API_PAGE_SIZE"])
+
+    try:
+        limit = int(limit)
+    except ValueError as error:
+        raise ValueError("limit must be a positive integer") from error
+
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+    return min(limit, config["API_MAX_PAGE_SIZE"]), request.args.get("cursor")
+
+
+def parse_datetime_arg(args, name):
+    """
+    Parse an ISO 8601 date and time query parameter, naive values are taken as UTC.
+
+    Raises:
+    - ValueError: If the value is not an ISO 8601 date and time.
+    """
+
+    try:
+        value = datetime.fromisoformat(args[name])
+    except ValueError as error:
+        raise ValueError(f"{name} must be an ISO 8601 date and time") from error
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value
+
+
+def parse_bool_arg(args, name):
+    """
+    Parse a true or false query parameter.
+
+    Raises:
+    - ValueError: If the value is neither true nor false.
+    """
+
+    value = args[name].lower()
+
+    if value not in ("true", "false"):
+        raise ValueError(f"{name} must be true or false")
+
+    return value == "true"
+
+
+def parse_fields_arg(args, fields, default):
+    """
+    Parse the comma-separated fields query parameter.
+
+    Args:
+    - args: The query parameters of the request.
+    - fields: The fields that can be selected, in the order they are returned.
+    - default: The fields returned when the parameter is missing.
+
+    Returns:
+    - fields: The selected fields, in the order of fields.
+
+    Raises:
+    - ValueError: If no field or an unknown field is selected.
+    """
+
+    if "fields" not in args:
+        return default
+
+    selected = {field.strip() for field in args["fields"].split(",")} - {""}
+    unknown = selected.difference(fields)
+
+    if not selected or unknown:
+        raise ValueError(
+            f"fields must be a comma-separated list of {', '.join(fields)}"
+        )
+
+    return tuple(field for field in fields if field in selected)
+
+
+def paginate(query, columns, limit, cursor=None, scalars=True):
+    """
+    Select one page of a query ordered by a unique sort key.
+
+    Args:
+    - query: The select statement of the entities or columns to paginate.
+    - columns: The model attributes making up the sort key, ending with a unique one.
+    - limit: The maximum number of rows of the page.
+    - cursor: The next_cursor of the previous page, None for the first page.
+    - scalars: Whether the query selects entities, False to return the selected rows.
+
+    Returns:
+    - page: A (rows, next_cursor) tuple, next_cursor is None on the last page.
+
+    Raises:
+    - ValueError: If the cursor is invalid.
+    """
+
+    if cursor is not None:
+        query = query.where(
+            sa.tuple_(*columns) > sa.tuple_(*decode_cursor(cursor, columns))
+        )
+
+    result = db.session.execute(query.order_by(*columns).limit(limit + 1))
+    rows = (result.scalars() if scalars else result).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(
+        [getattr(last, column.key) for column in columns]
+    )
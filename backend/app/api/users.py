@@ -6,7 +6,7 @@ It includes functionalities for retrieving user information, updating user detai
 deleting users, and managing occasions associated with a user.
 
 Routes:
-- /users: Retrieve a list of all users (requires admin privileges).
+- /users: Retrieve a filtered page of all users (requires admin privileges).
 - /users/<int:id>: Retrieve details of a specific user.
 - /users/<int:id>: Delete a specific user.
 - /users/<int:id>: Update details of a specific user.
@@ -20,6 +20,13 @@ import sqlalchemy as sa
 from app import db
 from app.api import bp
 from app.api.errors import bad_request, error_response
+from app.api.pagination import (
+    get_page_args,
+    paginate,
+    parse_bool_arg,
+    parse_datetime_arg,
+    parse_fields_arg,
+)
 from app.email import schedule_email
 from app.models import Occasion, User
 from flask import request
@@ -32,14 +39,47 @@ def get_users():
     """
     Get all users.
 
-    This endpoint returns a list of all the users from the database.
+    This endpoint returns a page of the users from the database, ordered by id.
 
     ---
     tags:
       - Users
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: The maximum number of users to return, up to API_MAX_PAGE_SIZE.
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: The next_cursor returned with the previous page.
+      - name: username
+        in: query
+        type: string
+        required: false
+        description: Only return the users whose username starts with this prefix.
+      - name: created_after
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only return the users created at or after this time.
+      - name: created_before
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only return the users created before this time.
+      - name: is_admin
+        in: query
+        type: boolean
+        required: false
+        description: Only return the administrators (true) or the other users (false).
     responses:
       200:
-        description: A successful response with a list of users.
+        description: A successful response with a page of users.
         content:
           application/json:
             schema:
@@ -49,7 +89,19 @@ def get_users():
                   type: array
                   items:
                     type: object
-                access_token:
+                next_cursor:
+                  type: string
+                  nullable: true
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
                   type: string
       401:
         description: Unauthorized.
@@ -67,15 +119,61 @@ def get_users():
     """
 
     if current_user.is_admin:
-        users = db.session.scalars(sa.select(User)).all()
+        # Only the serialized columns are selected, as plain rows
+        query = sa.select(
+            User.id, User.username, User.is_admin, User.created_at, User.email
+        )
+
+        try:
+            query = query.where(*user_filters(request.args))
+            limit, cursor = get_page_args()
+            users, next_cursor = paginate(
+                query, [User.id], limit, cursor, scalars=False
+            )
+        except ValueError as error:
+            return bad_request(str(error))
 
-        return {"users": [user.to_dict(include_email=True) for user in users]}
+        return {
+            "users": [user._asdict() for user in users],
+            "next_cursor": next_cursor,
+        }
 
     return error_response(
         401, "you do not have the necessary authorization for this action/resource"
     )
 
 
+def user_filters(args):
+    """
+    Build the conditions of the filters of GET /users.
+
+    Args:
+    - args: The query parameters of the request.
+
+    Returns:
+    - conditions: The WHERE conditions of the query.
+
+    Raises:
+    - ValueError: If a filter value is invalid.
+    """
+
+    conditions = []
+
+    if "username" in args:
+        conditions.append(User.username.startswith(args["username"], autoescape=True))
+
+    if "created_after" in args:
+        conditions.append(User.created_at >= parse_datetime_arg(args, "created_after"))
+
+    if "created_before" in args:
+        conditions.append(User.created_at < parse_datetime_arg(args, "created_before"))
+
+    if "is_admin" in args:
+        conditions.append(User.is_admin.is_(parse_bool_arg(args, "is_admin")))
+
+    return conditions
+
+
 @bp.route("/users/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_user(id):
@@ -313,6 +411,11 @@ def user_occasions(id):
        type: string
        required: true
        description: The id of the user.
+     - name: fields
+       in: query
+       type: string
+       required: false
+       description: Comma-separated list of the fields to return, message_content is only returned when selected.
     responses:
       200:
         description: A successful response with the list of occasions.
@@ -325,6 +428,17 @@ def user_occasions(id):
                   type: array
                   items:
                     type: object
+      400:
+        description: Bad request.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                message:
+                  type: string
       401:
         description: Unauthorized.
         content:
@@ -352,10 +466,21 @@ def user_occasions(id):
     """
 
     if id == current_user.id or current_user.is_admin:
+        try:
+            fields = parse_fields_arg(
+                request.args, Occasion.FIELDS, Occasion.FIELDS[:-1]
+            )
+        except ValueError as error:
+            return bad_request(str(error))
+
         user = db.get_or_404(User, id)
-        occasions = db.session.scalars(user.occasions.select())
+        occasions = db.session.scalars(
+            user.occasions.select().options(Occasion.load_only(fields))
+        )
 
-        return {"occasions": [occasion.to_dict() for occasion in occasions]}
+        return {
+            "occasions": [occasion.to_dict(fields=fields) for occasion in occasions]
+        }
 
     return error_response(
         401, "you do not have the necessary authorization for this action/resource"
@@ -477,10 +602,9 @@ def create_user_occasion(id):
             occasion = Occasion()
             occasion.from_dict(data)
             db.session.add(occasion)
-            db.session.commit()
+            schedule_email(occasion=occasion)
 
-            if occasion.delivery_method.lower() == "email":
-                schedule_email(occasion=occasion)
+            db.session.commit()
 
             return {"occasion": occasion.to_dict(include_message_content=True)}, 201
 
@@ -0,0 +1,8 @@
+"""
+__init__.py
+
+This package contains the delivery engine for the Memorable Messages Web Application.
+The occasions table is the source of truth for pending deliveries: instead of keeping one
+in-memory scheduler job per occasion, a periodic scanner reads due occasions from the
+database in time-ordered batches and delivers them.
+"""
@@ -0,0 +1,64 @@
+"""
+cli.py
+
+This file defines the "flask delivery" command group of the Memorable Messages Web Application.
+
+Commands:
+- flask delivery worker: Run a standalone delivery worker. Workers claim due occasions with
+  SELECT ... FOR UPDATE SKIP LOCKED, so as many of them as needed can run side by side,
+  on one or several machines, next to the scheduler leader.
+- flask delivery reconcile: Replay the deliveries missed while no process was delivering,
+  which the scheduler leader otherwise does when it starts.
+"""
+
+import signal
+import threading
+
+import click
+from app.delivery.queue import deliver_due
+from app.delivery.reconcile import reconcile
+from flask import current_app
+from flask.cli import AppGroup
+
+delivery_cli = AppGroup("delivery", help="Delivery engine commands.")
+
+
+@delivery_cli.command("worker")
+@click.option(
+    "--interval",
+    type=float,
+    default=None,
+    help="Seconds to wait when no occasion is due (defaults to DELIVERY_SCAN_INTERVAL).",
+)
+def worker(interval):
+    """Claim and deliver due occasions until the process is stopped."""
+
+    interval = interval or current_app.config["DELIVERY_SCAN_INTERVAL"]
+    stopped = threading.Event()
+
+    def stop(signum, frame):
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    current_app.logger.info("Delivery worker started")
+
+    while not stopped.is_set():
+        try:
+            delivered = deliver_due(stop=stopped)
+        except Exception:
+            current_app.logger.exception("Delivery worker failed to deliver occasions")
+            delivered = 0
+
+        if not delivered:
+            stopped.wait(interval)
+
+    current_app.logger.info("Delivery worker stopped")
+
+
+@delivery_cli.command("reconcile")
+def reconcile_command():
+    """Replay the deliveries missed while no process was delivering."""
+
+    click.echo(f"Recovered {reconcile()} missed deliveries")
@@ -0,0 +1,39 @@
+"""
+coalesce.py
+
+This file contains the optional coalescing stage of the delivery queue. On popular dates
+several users often write to the same person for the same occasion, and each message
+would otherwise be its own SMTP transaction. When DELIVERY_COALESCE is enabled, the emails
+of a claimed batch are grouped by recipient and by time bucket of DELIVERY_COALESCE_WINDOW
+seconds, and every group of more than one message is sent as a single combined email.
+Every occasion of a group still gets its own delivery history entry.
+
+Only occasions claimed in the same batch are coalesced: batches follow next_fire_at, so
+messages due at the same instant almost always share one.
+"""
+
+from collections import defaultdict
+
+
+def coalesce(payloads, fire_at, window):
+    """
+    Group the email payloads of a batch by recipient and time bucket.
+
+    Args:
+    - payloads: The email payloads of the batch, see load_payloads.
+    - fire_at: The next_fire_at of every occasion of the batch, keyed by occasion id.
+    - window: The length of the time buckets, in seconds.
+
+    Returns:
+    - groups: Lists of payloads to send as one email, in the order of the batch.
+    """
+
+    groups = defaultdict(list)
+
+    for payload in payloads:
+        bucket = int(fire_at[payload.id].timestamp() // window)
+        # Payloads without a recipient are never grouped
+        recipient = (payload.receiver_email or "").strip().lower() or payload.id
+        groups[(recipient, bucket)].append(payload)
+
+    return list(groups.values())
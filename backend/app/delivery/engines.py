@@ -0,0 +1,249 @@
+"""
+engines.py
+
+This file contains the delivery engines, which send the emails of the claimed occasions.
+
+- ThreadedEngine: sends every email with send_email on a thread of the delivery executor,
+  over the pooled SMTP connections. One OS thread is busy per email in flight. Emails go
+  through the priority lane passed by the caller, see executor.py.
+- AsyncioEngine: sends emails from a single event loop with aiosmtplib, keeping up to
+  DELIVERY_ASYNC_CONCURRENCY SMTP conversations open at once. Meant for peak dates with
+  a high fan-out. All its emails share the capacity of the engine, lanes are ignored.
+
+Both engines can also send the cached MIME message of an occasion with submit_mime, see
+mime.py. They return concurrent.futures.Future objects, so the delivery queue works the same
+whichever engine DELIVERY_ENGINE selects.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import aiosmtplib
+from app.delivery.executor import Capacity, delivery_executor
+from app.delivery.mime import stamp
+from app.email import send_email, send_governor, send_mime
+from flask import current_app
+from flask_mail import Message, email_dispatched, sanitize_address, sanitize_addresses
+
+
+class ThreadedEngine:
+    """Send emails on the threads of the delivery executor."""
+
+    def wait_for_capacity(self, limit, timeout=None, lane="scheduled"):
+        """Block until the lane can accept at least one email, see Capacity.wait."""
+
+        return delivery_executor.wait_for_capacity(limit, timeout, lane=lane)
+
+    def submit(
+        self, app, subject, sender, recipients, text_body, html_body, lane="scheduled"
+    ):
+        """Schedule an email to be sent on a lane. Returns a Future."""
+
+        return delivery_executor.submit(
+            send_email,
+            lane=lane,
+            app=app,
+            subject=subject,
+            sender=sender,
+            recipients=recipients,
+            text_body=text_body,
+            html_body=html_body,
+        )
+
+    def submit_mime(self, app, sender, recipients, data, lane="scheduled"):
+        """Schedule a cached MIME message to be sent on a lane. Returns a Future."""
+
+        return delivery_executor.submit(
+            send_mime,
+            lane=lane,
+            app=app,
+            sender=sender,
+            recipients=recipients,
+            data=data,
+        )
+
+
+class AsyncioEngine:
+    """
+    Send emails from an asyncio event loop running in a background thread.
+
+    SMTP connections are reused like the connections of the SMTP connection pool: they are
+    replaced after MAIL_POOL_MAX_MESSAGES messages or MAIL_POOL_IDLE_TIMEOUT seconds idle.
+
+    Attributes:
+    - concurrency: Maximum number of SMTP conversations in flight.
+    - capacity: Slots for the emails held by the engine, in flight or waiting.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read the engine settings from the application settings."""
+
+        self.stop()
+        config = app.config
+        self.concurrency = config["DELIVERY_ASYNC_CONCURRENCY"]
+        self.capacity = Capacity(self.concurrency + config["DELIVERY_QUEUE_SIZE"])
+        self.max_messages = config["MAIL_POOL_MAX_MESSAGES"]
+        self.idle_timeout = config["MAIL_POOL_IDLE_TIMEOUT"]
+        self.suppress = app.extensions["mail"].suppress
+        self.smtp_options = {
+            "hostname": config.get("MAIL_SERVER") or "127.0.0.1",
+            "port": int(config.get("MAIL_PORT") or 25),
+            "username": config.get("MAIL_USERNAME"),
+            "password": config.get("MAIL_PASSWORD"),
+            "use_tls": bool(config.get("MAIL_USE_SSL")),
+            "start_tls": bool(config.get("MAIL_USE_TLS")),
+        }
+
+    def wait_for_capacity(self, limit, timeout=None, lane=None):
+        """Block until the engine can accept at least one email, see Capacity.wait."""
+
+        return self.capacity.wait(limit, timeout)
+
+    def submit(self, app, subject, sender, recipients, text_body, html_body, lane=None):
+        """Schedule an email to be sent. Returns a Future."""
+
+        with app.app_context():
+            msg = Message(subject=subject, sender=sender, recipients=recipients)
+            msg.body = text_body
+            msg.html = html_body
+
+            if self.suppress:
+                email_dispatched.send(msg, app=current_app._get_current_object())
+                future = Future()
+                future.set_result(None)
+                return future
+
+            data = msg.as_bytes()
+
+        return self._submit(msg.sender, msg.send_to, data)
+
+    def submit_mime(self, app, sender, recipients, data, lane=None):
+        """Schedule a cached MIME message to be sent. Returns a Future."""
+
+        if self.suppress:
+            future = Future()
+            future.set_result(None)
+            return future
+
+        return self._submit(sender, recipients, stamp(data))
+
+    def _submit(self, sender, recipients, data):
+        send_governor.acquire(sender)
+        self.capacity.acquire()
+
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self._send(
+                    sanitize_address(sender),
+                    list(sanitize_addresses(recipients)),
+                    data,
+                ),
+                self._get_loop(),
+            )
+        except Exception:
+            self.capacity.release()
+            raise
+
+        future.add_done_callback(lambda _: self.capacity.release())
+        return future
+
+    def stop(self):
+        """Close the open SMTP connections and stop the event loop."""
+
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+
+        if loop is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def _get_loop(self):
+        """Start the event loop thread on first use."""
+
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                self._idle = []
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="delivery-asyncio", daemon=True
+                )
+                self._thread.start()
+
+            return self._loop
+
+    async def _send(self, sender, recipients, data):
+        async with self._semaphore:
+            client, sent = await self._checkout()
+
+            try:
+                await client.sendmail(sender, recipients, data)
+            except aiosmtplib.SMTPServerDisconnected:
+                await self._discard(client)
+                client, sent = await self._connect(), 0
+                try:
+                    await client.sendmail(sender, recipients, data)
+                except Exception:
+                    await self._discard(client)
+                    raise
+            except Exception:
+                await self._discard(client)
+                raise
+
+            await self._checkin(client, sent + 1)
+
+    async def _checkout(self):
+        while self._idle:
+            client, sent, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.idle_timeout:
+                return client, sent
+            await self._discard(client)
+
+        return await self._connect(), 0
+
+    async def _checkin(self, client, sent):
+        if sent >= self.max_messages:
+            await self._discard(client)
+        else:
+            self._idle.append((client, sent, time.monotonic()))
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(**self.smtp_options)
+        await client.connect()
+        return client
+
+    async def _discard(self, client):
+        try:
+            await client.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            client.close()
+
+    async def _close(self):
+        while self._idle:
+            client, _, _ = self._idle.pop()
+            await self._discard(client)
+
+
+threaded_engine = ThreadedEngine()
+asyncio_engine = AsyncioEngine()
+
+
+def get_engine():
+    """Return the delivery engine selected by the DELIVERY_ENGINE setting."""
+
+    if current_app.config["DELIVERY_ENGINE"] == "asyncio":
+        return asyncio_engine
+
+    return threaded_engine
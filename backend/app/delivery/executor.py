@@ -0,0 +1,325 @@
+"""
+executor.py
+
+This file contains the delivery executor: the thread pool that sends the claimed deliveries.
+Deliveries are submitted to named priority lanes configured by DELIVERY_LANES:
+
+- transactional: emails a user is waiting for, such as password resets.
+- scheduled: occasions sent by the delivery scanner, on time or retried.
+- replay: deliveries missed during an outage and replayed by the reconciliation.
+
+The DELIVERY_MAX_WORKERS threads of the executor pick their next delivery from the lanes
+with smooth weighted round-robin, so every lane with work gets a share of the threads
+proportional to its weight, and no lane runs more than its max_workers deliveries at once.
+The caps of the bulk lanes, scheduled and replay, must add up to less than
+DELIVERY_MAX_WORKERS, which init_app checks: the threads left over are always free for the
+transactional lane, so neither a delivery backlog nor a bulk replay after an outage can
+starve it.
+
+Each lane also holds at most queue_size deliveries waiting for a thread. The scanner only
+claims as many occasions as its lane has free slots, so a full lane stops it from claiming
+more work instead of piling up pending deliveries in memory.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from app.delivery.metrics import metrics
+
+
+class LaneFull(Exception):
+    """Raised when a delivery could not be submitted before its lane had a free slot."""
+
+
+# Lanes whose deliveries must always leave a thread free for the transactional lane
+BULK_LANES = ("scheduled", "replay")
+
+
+class Capacity:
+    """
+    Bounded number of slots shared by the threads submitting deliveries.
+
+    Attributes:
+    - size: Total number of slots.
+    - pending: Number of slots in use.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.pending = 0
+        self._condition = threading.Condition()
+
+    def available(self):
+        """Return the number of free slots."""
+
+        with self._condition:
+            return self.size - self.pending
+
+    def saturation(self):
+        """Return the share of slots in use, between 0 and 1."""
+
+        with self._condition:
+            return self.pending / self.size
+
+    def wait(self, limit, timeout=None):
+        """
+        Block until at least one slot is free.
+
+        Args:
+        - limit: The maximum number of slots the caller wants.
+        - timeout: Seconds to wait at most, forever if None.
+
+        Returns:
+        - count: The number of free slots, up to limit (0 on timeout).
+        """
+
+        with self._condition:
+            if self.pending >= self.size:
+                metrics.increment("executor.saturated")
+                self._condition.wait_for(lambda: self.pending < self.size, timeout)
+
+            return max(0, min(limit, self.size - self.pending))
+
+    def acquire(self, timeout=None):
+        """
+        Take a slot, blocking while none is free.
+
+        Args:
+        - timeout: Seconds to wait at most, forever if None.
+
+        Returns:
+        - acquired: Whether a slot was taken before the timeout.
+        """
+
+        with self._condition:
+            if self.pending >= self.size:
+                metrics.increment("executor.saturated")
+                if not self._condition.wait_for(
+                    lambda: self.pending < self.size, timeout
+                ):
+                    return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        """Give a slot back."""
+
+        with self._condition:
+            self.pending -= 1
+            self._condition.notify_all()
+
+
+class Lane:
+    """
+    Queue of deliveries sharing a priority.
+
+    Attributes:
+    - name: Name of the lane.
+    - weight: Share of the threads the lane gets when other lanes have work too.
+    - max_workers: Maximum number of deliveries of the lane sent at the same time.
+    - queue_size: Maximum number of deliveries of the lane waiting for a free thread.
+    - capacity: Slots for the deliveries held by the lane, running or queued.
+    """
+
+    def __init__(self, name, weight, max_workers, queue_size):
+        self.name = name
+        self.weight = weight
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.capacity = Capacity(max_workers + queue_size)
+        self.tasks = deque()
+        self.running = 0
+        self.current = 0
+
+
+class LaneScheduler:
+    """Worker threads running the deliveries of a set of lanes."""
+
+    def __init__(self, lanes, max_workers):
+        self.lanes = lanes
+        self.running = 0
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"delivery-{number}", daemon=True)
+            for number in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, lane, fn, args, kwargs, timeout=None):
+        if not lane.capacity.acquire(timeout):
+            raise LaneFull(f"the {lane.name} lane is full")
+
+        future = Future()
+
+        with self._condition:
+            if self._shutdown:
+                lane.capacity.release()
+                raise RuntimeError("cannot submit deliveries after shutdown")
+
+            lane.tasks.append((future, fn, args, kwargs, time.monotonic()))
+            self._condition.notify()
+
+        return future
+
+    def shutdown(self, wait):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next(self):
+        """Pick the lane of the next delivery with smooth weighted round-robin."""
+
+        eligible = [
+            lane
+            for lane in self.lanes.values()
+            if lane.tasks and lane.running < lane.max_workers
+        ]
+        if not eligible:
+            return None
+
+        for lane in eligible:
+            lane.current += lane.weight
+        lane = max(eligible, key=lambda lane: lane.current)
+        lane.current -= sum(lane.weight for lane in eligible)
+
+        lane.running += 1
+        self.running += 1
+        return lane, lane.tasks.popleft()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while (task := self._next()) is None:
+                    if self._shutdown:
+                        return
+                    self._condition.wait()
+
+            lane, (future, fn, args, kwargs, submitted_at) = task
+            metrics.observe(f"lanes.{lane.name}.wait", time.monotonic() - submitted_at)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            with self._condition:
+                lane.running -= 1
+                self.running -= 1
+                # A capped lane may have become eligible again
+                self._condition.notify_all()
+
+            lane.capacity.release()
+
+
+class DeliveryExecutor:
+    """
+    Bounded thread pool with priority lanes and backpressure.
+
+    Attributes:
+    - max_workers: Number of threads sending deliveries.
+    - lanes: The lanes of the executor, keyed by name.
+    """
+
+    def __init__(self):
+        self._scheduler = None
+
+    def init_app(self, app):
+        """
+        Create the lanes and the worker threads from the application settings.
+
+        Raises:
+        - ValueError: If the bulk lanes can take every thread of the executor.
+        """
+
+        max_workers = app.config["DELIVERY_MAX_WORKERS"]
+        lanes = {
+            name: Lane(name, **settings)
+            for name, settings in app.config["DELIVERY_LANES"].items()
+        }
+
+        if sum(lanes[name].max_workers for name in BULK_LANES if name in lanes) >= (
+            max_workers
+        ):
+            raise ValueError(
+                "the max_workers of the scheduled and replay lanes must add up to "
+                "less than DELIVERY_MAX_WORKERS"
+            )
+
+        self.shutdown(wait=False)
+        self.max_workers = max_workers
+        self.lanes = lanes
+        scheduler = self._scheduler = LaneScheduler(self.lanes, self.max_workers)
+
+        metrics.gauge("executor.max_workers", lambda: self.max_workers)
+        metrics.gauge("executor.running", lambda: scheduler.running)
+
+        for lane in self.lanes.values():
+            metrics.gauge(f"lanes.{lane.name}.depth", lambda lane=lane: len(lane.tasks))
+            metrics.gauge(f"lanes.{lane.name}.running", lambda lane=lane: lane.running)
+            metrics.gauge(f"lanes.{lane.name}.saturation", lane.capacity.saturation)
+
+    def available(self, lane="scheduled"):
+        """Return the number of deliveries the lane can accept right now."""
+
+        return self.lanes[lane].capacity.available()
+
+    def saturation(self, lane="scheduled"):
+        """Return the share of the lane capacity in use, between 0 and 1."""
+
+        return self.lanes[lane].capacity.saturation()
+
+    def wait_for_capacity(self, limit, timeout=None, lane="scheduled"):
+        """
+        Block until the lane can accept at least one delivery.
+
+        Args:
+        - limit: The maximum number of deliveries the caller wants to submit.
+        - timeout: Seconds to wait at most, forever if None.
+        - lane: The name of the lane.
+
+        Returns:
+        - count: The number of deliveries that can be submitted, up to limit (0 on timeout).
+        """
+
+        return self.lanes[lane].capacity.wait(limit, timeout)
+
+    def submit(self, fn, *args, lane="scheduled", timeout=None, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) to be run by a delivery thread.
+
+        Blocks while the lane is full, for timeout seconds at most if it is not None.
+
+        Returns:
+        - future: A Future representing the execution of the delivery.
+
+        Raises:
+        - LaneFull: If the lane is still full after timeout seconds.
+        """
+
+        return self._scheduler.submit(self.lanes[lane], fn, args, kwargs, timeout)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads once the submitted deliveries are sent.
+
+        Args:
+        - wait: Whether to block until the submitted deliveries are sent.
+        """
+
+        if self._scheduler is not None:
+            self._scheduler.shutdown(wait=wait)
+            self._scheduler = None
+
+
+delivery_executor = DeliveryExecutor()
@@ -0,0 +1,172 @@
+"""
+leader.py
+
+This file contains the leader election for the background scheduler. Every process created
+by create_app (one per gunicorn worker, on every node) takes part in the election, but only
+the process holding a Postgres advisory lock starts the scheduler and dispatches deliveries.
+The other processes only serve HTTP requests.
+
+The lock is a session-level lock held on a dedicated database connection, so it is released
+by Postgres as soon as the leader process dies or loses its connection, and another process
+takes over on its next election round.
+
+Note: the election runs in a background thread, so the application must be created after
+gunicorn forks its workers (do not use --preload).
+"""
+
+import atexit
+import threading
+
+import sqlalchemy as sa
+from app import db, scheduler
+from apscheduler.schedulers.base import STATE_STOPPED
+
+
+class LeaderElection:
+    """
+    Elect a single process of the deployment to run the scheduler.
+
+    Attributes:
+    - scheduler: The scheduler started when this process becomes the leader.
+    - is_leader: Flag indicating if this process currently holds the leader lock.
+    """
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler
+        self.is_leader = False
+        self._connection = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """
+        Read the election settings and start the election for the application.
+
+        Without SCHEDULER_LEADER_ELECTION, or on a database without advisory locks,
+        the process becomes the leader right away as before.
+        """
+
+        self.app = app
+        self.lock_id = app.config["SCHEDULER_LEADER_LOCK_ID"]
+        self.poll_interval = app.config["SCHEDULER_LEADER_POLL_INTERVAL"]
+
+        if not app.config["SCHEDULER_AUTOSTART"]:
+            return
+
+        with app.app_context():
+            supported = db.engine.dialect.name == "postgresql"
+
+        if not app.config["SCHEDULER_LEADER_ELECTION"] or not supported:
+            self._set_leader(True)
+            return
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="scheduler-leader-election", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def acquire(self):
+        """Try to take the leader lock. Returns True if this process is the leader."""
+
+        if self.is_leader:
+            return True
+
+        with self.app.app_context():
+            connection = db.engine.connect()
+
+        try:
+            acquired = connection.scalar(
+                sa.select(sa.func.pg_try_advisory_lock(self.lock_id))
+            )
+            connection.commit()
+        except sa.exc.DBAPIError:
+            connection.invalidate()
+            connection.close()
+            return False
+
+        if not acquired:
+            connection.close()
+            return False
+
+        self._connection = connection
+        self._set_leader(True)
+        return True
+
+    def check(self):
+        """Verify the leader still holds the lock, stepping down if its connection is gone."""
+
+        if not self.is_leader or self._connection is None:
+            return self.is_leader
+
+        try:
+            self._connection.scalar(sa.select(1))
+            self._connection.commit()
+        except sa.exc.DBAPIError:
+            self.app.logger.warning("Lost the scheduler leader lock")
+            self._connection.invalidate()
+            self._connection.close()
+            self._connection = None
+            self._set_leader(False)
+
+        return self.is_leader
+
+    def release(self):
+        """Give up the leader lock so another process can take over."""
+
+        if self._connection is not None:
+            try:
+                self._connection.scalar(
+                    sa.select(sa.func.pg_advisory_unlock(self.lock_id))
+                )
+                self._connection.commit()
+            except sa.exc.DBAPIError:
+                self._connection.invalidate()
+            self._connection.close()
+            self._connection = None
+
+        self._set_leader(False)
+
+    def stop(self):
+        """Stop taking part in the election and release the lock."""
+
+        self._stopped.set()
+        self.release()
+
+    def _run(self):
+        """Election loop: keep trying to become the leader and watch the lock once elected."""
+
+        while not self._stopped.is_set():
+            try:
+                if self.is_leader:
+                    self.check()
+                else:
+                    self.acquire()
+            except Exception:
+                self.app.logger.exception("Scheduler leader election failed")
+
+            self._stopped.wait(self.poll_interval)
+
+    def _set_leader(self, is_leader):
+        """Start or pause the scheduler when this process gains or loses leadership."""
+
+        if is_leader == self.is_leader:
+            return
+
+        self.is_leader = is_leader
+
+        if self.scheduler is None:
+            return
+
+        if is_leader:
+            self.app.logger.info("Elected scheduler leader, starting the scheduler")
+            if self.scheduler.state == STATE_STOPPED:
+                self.scheduler.start()
+            else:
+                self.scheduler.resume()
+        elif self.scheduler.running:
+            self.scheduler.pause()
+
+
+leader_election = LeaderElection(scheduler)
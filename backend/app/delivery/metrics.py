@@ -0,0 +1,69 @@
+"""
+metrics.py
+
+This file contains the in-process metrics of the delivery engine. Counters and timings are
+recorded by the delivery code, gauges are read from their source when a snapshot is taken,
+and the snapshot is served to administrators by the /delivery/metrics API route.
+"""
+
+import threading
+
+
+class Metrics:
+    """Thread-safe registry of counters, timings and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+        self._gauges = {}
+
+    def increment(self, name, value=1):
+        """Add value to the counter called name."""
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record a duration, keeping its count, total and maximum."""
+
+        with self._lock:
+            timing = self._timings.setdefault(
+                name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            timing["count"] += 1
+            timing["total_seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+    def gauge(self, name, callback):
+        """Register a callback returning the current value of the gauge called name."""
+
+        with self._lock:
+            self._gauges[name] = callback
+
+    def snapshot(self):
+        """Return the current value of every metric."""
+
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: dict(timing) for name, timing in self._timings.items()}
+            gauges = dict(self._gauges)
+
+        for timing in timings.values():
+            timing["average_seconds"] = timing["total_seconds"] / timing["count"]
+
+        return {
+            "counters": counters,
+            "timings": timings,
+            "gauges": {name: callback() for name, callback in gauges.items()},
+        }
+
+    def reset(self):
+        """Forget every counter and timing."""
+
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
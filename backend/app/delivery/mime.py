@@ -0,0 +1,122 @@
+"""
+mime.py
+
+This file contains the cache of pre-built MIME messages. The content of an occasion only
+changes when the occasion is updated, yet its email would otherwise be rendered and
+encoded again at every delivery and every yearly repeat. When DELIVERY_MIME_CACHE is
+enabled, the outbox relay builds the MIME message of every created or updated occasion and
+stores its bytes in the message_cache table, keyed by occasion and version. At fire time
+load_payloads picks up the bytes of the current version, and they are written to the SMTP
+connection as they are.
+
+The Date and Message-ID headers are left out of the cached bytes and added by stamp at
+send time, so every delivery of a repeated occasion still gets its own. Updating an
+occasion deletes its entry, and an entry built for another version or sender is never used.
+"""
+
+from email.utils import formatdate, make_msgid
+
+import sqlalchemy as sa
+from app import db
+from app.delivery.metrics import metrics
+from app.models import MessageCache, Occasion, User
+from app.rendering import renderer
+from flask_mail import Message
+from sqlalchemy.dialects.postgresql import insert
+
+
+def build_mime(subject, sender, recipients, text_body, html_body):
+    """
+    Build the MIME message of an email without its Date and Message-ID headers.
+
+    Must be called within an application context.
+
+    Returns:
+    - data: The message bytes, with CRLF line endings.
+    """
+
+    msg = Message(subject=subject, sender=sender, recipients=recipients)
+    msg.body = text_body
+    msg.html = html_body
+    mime = msg._message()
+    del mime["Date"]
+    del mime["Message-ID"]
+
+    return mime.as_bytes(policy=mime.policy.clone(linesep="\r\n"))
+
+
+def stamp(data):
+    """Prepend fresh Date and Message-ID headers to cached message bytes."""
+
+    headers = f"Date: {formatdate(localtime=True)}\r\nMessage-ID: {make_msgid()}\r\n"
+    return headers.encode() + data
+
+
+def cache_messages(occasion_ids):
+    """
+    Build and store the MIME messages of the current version of email occasions.
+
+    Args:
+    - occasion_ids: The ids of the occasions to build the messages of.
+
+    Returns:
+    - cached: The number of messages built.
+    """
+
+    payloads = db.session.execute(
+        sa.select(
+            Occasion.id,
+            Occasion.version,
+            Occasion.occasion_type,
+            Occasion.message_content,
+            Occasion.receiver_email,
+            User.email.label("sender"),
+        )
+        .join(Occasion.user)
+        .where(
+            Occasion.id.in_(occasion_ids),
+            sa.func.lower(Occasion.delivery_method) == "email",
+        )
+    ).all()
+
+    if not payloads:
+        return 0
+
+    bodies = renderer.render_occasions(payloads)
+    rows = [
+        {
+            "occasion_id": payload.id,
+            "version": payload.version,
+            "sender": payload.sender,
+            "data": build_mime(
+                payload.occasion_type,
+                payload.sender,
+                [payload.receiver_email],
+                *bodies[payload.id],
+            ),
+        }
+        for payload in payloads
+    ]
+    statement = insert(MessageCache).values(rows)
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[MessageCache.occasion_id],
+            set_={
+                "version": statement.excluded.version,
+                "sender": statement.excluded.sender,
+                "data": statement.excluded.data,
+                "created_at": sa.func.now(),
+            },
+        )
+    )
+    metrics.increment("mime.cached", len(rows))
+
+    return len(rows)
+
+
+def invalidate(occasion):
+    """Delete the cached message of an occasion."""
+
+    db.session.execute(
+        sa.delete(MessageCache).where(MessageCache.occasion_id == occasion.id)
+    )
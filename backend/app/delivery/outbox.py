@@ -0,0 +1,93 @@
+"""
+outbox.py
+
+This file contains the relay of the delivery outbox. When an occasion is created or updated,
+schedule_email only parks it and writes a delivery_outbox entry in the same transaction, so
+the HTTP request commits once and returns without touching the delivery queue. Every
+DELIVERY_OUTBOX_INTERVAL seconds the relay applies the pending entries in batches of
+DELIVERY_OUTBOX_BATCH_SIZE: it arms the next_fire_at of the changed occasions with one bulk
+update and deletes the entries, in one transaction per batch. When DELIVERY_MIME_CACHE is
+enabled, the MIME messages of the changed occasions are built in the same transaction.
+
+Entries are claimed with FOR UPDATE SKIP LOCKED, together with their occasions, so several
+relays never apply the same entry twice and an occasion is never armed from a date and time
+that a concurrent update is changing: the entries of a locked occasion wait for the next
+run. An entry is only deleted with the change it describes, so a crash only delays the
+change until the next run. Entries only say which occasion changed, the relay reads what
+to apply from the occasion itself, so several entries of an occasion are applied at once.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from app import db, scheduler
+from app.delivery.metrics import metrics
+from app.delivery.mime import cache_messages
+from app.delivery.recurrence import first_fire_at
+from app.events import reschedule
+from app.models import DeliveryOutbox, Occasion
+from flask import current_app
+
+
+def relay(now=None):
+    """
+    Apply the pending outbox entries to the delivery queue.
+
+    Args:
+    - now: The time of the relay, defaults to the current time.
+
+    Returns:
+    - relayed: The number of outbox entries applied.
+    """
+
+    now = now or datetime.now(timezone.utc)
+    config = current_app.config
+    after = now - timedelta(seconds=config["DELIVERY_MISFIRE_GRACE_TIME"])
+    relayed = 0
+
+    while True:
+        entries = db.session.execute(
+            sa.select(
+                DeliveryOutbox.id,
+                Occasion.id.label("occasion_id"),
+                Occasion.date_time,
+                Occasion.is_repeated,
+            )
+            .join(DeliveryOutbox.occasion)
+            .order_by(DeliveryOutbox.id)
+            .limit(config["DELIVERY_OUTBOX_BATCH_SIZE"])
+            .with_for_update(skip_locked=True, of=(DeliveryOutbox, Occasion))
+        ).all()
+
+        if not entries:
+            db.session.commit()
+            break
+
+        reschedule(
+            {
+                entry.occasion_id: first_fire_at(
+                    entry.date_time, entry.is_repeated, after
+                )
+                for entry in entries
+            },
+            attempts=0,
+        )
+        if config["DELIVERY_MIME_CACHE"]:
+            cache_messages([entry.occasion_id for entry in entries])
+        db.session.execute(
+            sa.delete(DeliveryOutbox).where(
+                DeliveryOutbox.id.in_([entry.id for entry in entries])
+            )
+        )
+        db.session.commit()
+        relayed += len(entries)
+
+    metrics.increment("outbox.relayed", relayed)
+    return relayed
+
+
+def relay_outbox():
+    """Scheduled job that applies the pending outbox entries."""
+
+    with scheduler.app.app_context():
+        return relay()
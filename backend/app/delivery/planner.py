@@ -0,0 +1,118 @@
+"""
+planner.py
+
+This file contains the dispatch planner, which smooths out the clusters of occasions due at
+the same instant, such as midnight on January 1 or 09:00 on Valentine's Day. Every
+DELIVERY_PLAN_INTERVAL seconds the planner looks DELIVERY_PLAN_HORIZON seconds ahead for
+instants with at least DELIVERY_PLAN_CLUSTER_SIZE occasions, and spreads each cluster over
+DELIVERY_PLAN_WINDOW seconds by moving the next_fire_at of its occasions. Up to
+DELIVERY_PLAN_EARLY_START seconds of the window may be taken before the instant, so the
+first deliveries go out early instead of everyone waiting behind the spike.
+
+The offset of every occasion is derived from its id, so the plan is deterministic, and a
+spread cluster no longer shares an instant, so running the planner again changes nothing.
+Only next_fire_at moves: anniversaries of repeated occasions are still computed from their
+date and time.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from app import db, scheduler
+from app.delivery.metrics import metrics
+from app.models import Occasion
+from flask import current_app
+
+# Multiplier of Knuth's multiplicative hash, spreading consecutive ids over the window
+HASH_MULTIPLIER = 2654435761
+
+
+def find_clusters(start, end, cluster_size):
+    """
+    Find the instants between start and end at which at least cluster_size occasions are due.
+
+    Returns:
+    - clusters: A list of (instant, count) rows.
+    """
+
+    return db.session.execute(
+        sa.select(Occasion.next_fire_at, sa.func.count())
+        .where(Occasion.next_fire_at > start, Occasion.next_fire_at <= end)
+        .group_by(Occasion.next_fire_at)
+        .having(sa.func.count() >= cluster_size)
+        .order_by(Occasion.next_fire_at)
+    ).all()
+
+
+def spread(instant, window, early_start):
+    """
+    Spread the occasions due at an instant over a window with a single UPDATE.
+
+    Args:
+    - instant: The next_fire_at shared by the occasions of the cluster.
+    - window: The number of seconds to spread the cluster over.
+    - early_start: The number of seconds of the window before the instant.
+
+    Returns:
+    - spread: The number of occasions moved.
+    """
+
+    milliseconds = window * 1000
+    offset = (sa.cast(Occasion.id, sa.BigInteger) * HASH_MULTIPLIER) % milliseconds
+    result = db.session.execute(
+        sa.update(Occasion)
+        .where(Occasion.next_fire_at == instant)
+        .values(
+            next_fire_at=instant
+            - timedelta(seconds=early_start)
+            + sa.func.make_interval(0, 0, 0, 0, 0, 0, offset / 1000.0)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    return result.rowcount
+
+
+def plan(now=None):
+    """
+    Spread the clusters of occasions due within the planning horizon.
+
+    Clusters due before their early start are left alone, the delivery scanner may
+    already be sending them.
+
+    Args:
+    - now: The time of the planning, defaults to the current time.
+
+    Returns:
+    - planned: The number of occasions moved.
+    """
+
+    now = now or datetime.now(timezone.utc)
+    config = current_app.config
+    early_start = config["DELIVERY_PLAN_EARLY_START"]
+    planned = 0
+
+    for instant, count in find_clusters(
+        now + timedelta(seconds=early_start),
+        now + timedelta(seconds=config["DELIVERY_PLAN_HORIZON"]),
+        config["DELIVERY_PLAN_CLUSTER_SIZE"],
+    ):
+        planned += spread(instant, config["DELIVERY_PLAN_WINDOW"], early_start)
+        current_app.logger.info(
+            "Spread %d occasions due at %s over %d seconds",
+            count,
+            instant.isoformat(),
+            config["DELIVERY_PLAN_WINDOW"],
+        )
+
+    db.session.commit()
+    metrics.increment("planner.spread", planned)
+
+    return planned
+
+
+def plan_delivery_clusters():
+    """Scheduled job that spreads the upcoming clusters of occasions."""
+
+    with scheduler.app.app_context():
+        return plan()
@@ -0,0 +1,317 @@
+"""
+queue.py
+
+This file contains the database-backed delivery queue. Pending deliveries are the rows of
+the occasions table with a next_fire_at, so nothing is lost when a process restarts. The
+scanner walks due occasions through the index on next_fire_at in batches of
+DELIVERY_BATCH_SIZE, which keeps memory use flat no matter how many occasions are pending.
+
+Batches are claimed with SELECT ... FOR UPDATE SKIP LOCKED, and the messages of a batch are
+sent and recorded in the transaction holding the claim. Any number of delivery workers
+(see the "flask delivery worker" command) can therefore drain the same due occasions
+concurrently without sending anything twice.
+
+A claim only carries the id and next_fire_at of each occasion. The sender, recipient and
+message of a batch are loaded with a single query right before it is sent, so pending and
+claimed deliveries never hold copies of the message bodies. The claimed rows stay locked
+until the batch is recorded, so the loaded messages are those of the claimed versions.
+The emails of a batch are then rendered together from the occasion templates, see
+rendering.py, unless their MIME message was already built when the occasion was written,
+see mime.py. Occasions delivered by SMS are sent in batches through the SMS channel, see
+sms.py, when an SMS provider is set.
+Emails to the same recipient can optionally be combined, see coalesce.py.
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from app import db, scheduler
+from app.delivery.coalesce import coalesce
+from app.delivery.engines import get_engine
+from app.delivery.metrics import metrics
+from app.events import HistoryWriter
+from app.models import MessageCache, Occasion, User
+from app.rendering import renderer
+from app.sms import SMS, sms_channel
+from flask import current_app
+
+Delivery = namedtuple("Delivery", ["occasion_id", "next_fire_at"])
+
+
+def delivery_channels():
+    """Return the delivery methods of the occasions the scanner delivers."""
+
+    if sms_channel.enabled:
+        return ("email", "sms")
+
+    return ("email",)
+
+
+def due_occasions(now, batch_size, after=None):
+    """
+    Build the query claiming the next batch of due occasions.
+
+    Occasions are ordered by (next_fire_at, id) and paged with a keyset so every batch is a
+    range scan on the next_fire_at index. Occasions that became due longer than
+    DELIVERY_MISFIRE_GRACE_TIME seconds ago are considered missed and are left alone.
+    The selected rows are locked until the end of the transaction, and rows already
+    locked by another worker are skipped. Only the id and next_fire_at columns are
+    selected.
+
+    Args:
+    - now: The current time.
+    - batch_size: The maximum number of occasions to select.
+    - after: The (next_fire_at, id) of the last occasion of the previous batch, if any.
+
+    Returns:
+    - query: The select statement for the batch, returning Delivery rows.
+    """
+
+    grace_time = timedelta(seconds=current_app.config["DELIVERY_MISFIRE_GRACE_TIME"])
+    query = (
+        sa.select(Occasion.id, Occasion.next_fire_at)
+        .where(
+            sa.func.lower(Occasion.delivery_method).in_(delivery_channels()),
+            Occasion.next_fire_at > now - grace_time,
+            Occasion.next_fire_at <= now,
+        )
+        .order_by(Occasion.next_fire_at, Occasion.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=Occasion)
+    )
+
+    if after is not None:
+        query = query.where(sa.tuple_(Occasion.next_fire_at, Occasion.id) > after)
+
+    return query
+
+
+def load_payloads(deliveries):
+    """
+    Load the message data of a batch of claimed deliveries with one query.
+
+    Must be called in the transaction holding the claim, so the occasions cannot be updated
+    or deleted in between. When DELIVERY_MIME_CACHE is enabled, the cached MIME message of
+    the current version is loaded as mime, None if there is none.
+
+    Args:
+    - deliveries: The claimed Delivery rows.
+
+    Returns:
+    - payloads: The message data of each delivery, keyed by occasion id.
+    """
+
+    query = (
+        sa.select(
+            Occasion.id,
+            Occasion.version,
+            Occasion.delivery_method,
+            Occasion.occasion_type,
+            Occasion.message_content,
+            Occasion.receiver_email,
+            Occasion.receiver_phone,
+            User.email.label("sender"),
+        )
+        .join(Occasion.user)
+        .where(Occasion.id.in_([delivery.occasion_id for delivery in deliveries]))
+    )
+
+    if current_app.config["DELIVERY_MIME_CACHE"]:
+        query = query.outerjoin(
+            MessageCache,
+            sa.and_(
+                MessageCache.occasion_id == Occasion.id,
+                MessageCache.version == Occasion.version,
+                MessageCache.sender == User.email,
+            ),
+        ).add_columns(MessageCache.data.label("mime"))
+    else:
+        query = query.add_columns(sa.null().label("mime"))
+
+    rows = db.session.execute(query)
+
+    return {row.id: row for row in rows}
+
+
+def deliver_claimed(claim, stop=None, rate=None, lane="scheduled"):
+    """
+    Deliver the occasions selected by a claim query, one claimed batch at a time.
+
+    Batches are only as large as the free capacity of the delivery engine, which sends the
+    emails of a batch concurrently. The statuses of the sent emails are buffered by a
+    HistoryWriter, and each flush commits the transaction, which releases the claims of the
+    batches sent so far. A crash therefore only replays the deliveries that were not
+    flushed yet. An occasion whose email could not be sent is recorded as FAILED and put
+    back in the queue with a backoff, see update_status.
+
+    Args:
+    - claim: A function (limit, after) returning the select statement claiming the next
+      batch, see due_occasions.
+    - stop: An optional threading.Event, no new batch is claimed once it is set.
+    - rate: The maximum number of messages sent per second, unlimited if None.
+    - lane: The priority lane of the delivery executor the messages are sent on.
+
+    Returns:
+    - delivered: The number of occasions delivered.
+    """
+
+    config = current_app.config
+    app = current_app._get_current_object()
+    engine = get_engine()
+    delivered = 0
+    submitted = 0
+    after = None
+    start = time.monotonic()
+
+    with HistoryWriter(
+        config["DELIVERY_HISTORY_FLUSH_SIZE"], config["DELIVERY_HISTORY_FLUSH_INTERVAL"]
+    ) as history:
+        while stop is None or not stop.is_set():
+            limit = engine.wait_for_capacity(config["DELIVERY_BATCH_SIZE"], lane=lane)
+            if rate:
+                limit = min(limit, max(1, int(rate)))
+
+            deliveries = [
+                Delivery(*row) for row in db.session.execute(claim(limit, after))
+            ]
+
+            if not deliveries:
+                break
+
+            payloads = load_payloads(deliveries)
+            metrics.increment("deliveries.stale", len(deliveries) - len(payloads))
+            emails = {
+                occasion_id: payload
+                for occasion_id, payload in payloads.items()
+                if payload.delivery_method.lower() == "email"
+            }
+            texts = [
+                payload
+                for payload in payloads.values()
+                if payload.delivery_method.lower() == "sms"
+            ]
+            if config["DELIVERY_COALESCE"]:
+                fire_at = {
+                    delivery.occasion_id: delivery.next_fire_at
+                    for delivery in deliveries
+                }
+                groups = coalesce(
+                    emails.values(), fire_at, config["DELIVERY_COALESCE_WINDOW"]
+                )
+            else:
+                groups = [[payload] for payload in emails.values()]
+
+            singles = [group[0] for group in groups if len(group) == 1]
+            bodies = renderer.render_occasions(
+                payload for payload in singles if payload.mime is None
+            )
+            metrics.increment("mime.hits", len(singles) - len(bodies))
+
+            futures = {}
+            for group in groups:
+                payload = group[0]
+
+                if len(group) > 1:
+                    text_body, html_body = renderer.render_coalesced(group)
+                    future = engine.submit(
+                        app=app,
+                        subject=f"You have {len(group)} messages",
+                        sender=config["ADMINS"][0],
+                        recipients=[payload.receiver_email],
+                        text_body=text_body,
+                        html_body=html_body,
+                        lane=lane,
+                    )
+                    metrics.increment("deliveries.coalesced", len(group) - 1)
+                elif payload.mime is not None:
+                    future = engine.submit_mime(
+                        app=app,
+                        sender=payload.sender,
+                        recipients=[payload.receiver_email],
+                        data=payload.mime,
+                        lane=lane,
+                    )
+                else:
+                    future = engine.submit(
+                        app=app,
+                        subject=payload.occasion_type,
+                        sender=payload.sender,
+                        recipients=[payload.receiver_email],
+                        text_body=bodies[payload.id][0],
+                        html_body=bodies[payload.id][1],
+                        lane=lane,
+                    )
+                futures[future] = [member.id for member in group]
+
+            if texts:
+                messages = [
+                    SMS(payload.receiver_phone, payload.message_content)
+                    for payload in texts
+                ]
+                for future, indexes in sms_channel.submit(messages, lane).items():
+                    futures[future] = [texts[index].id for index in indexes]
+
+            for future, occasion_ids in futures.items():
+                # Email futures resolve to None, SMS futures to the errors of their texts
+                try:
+                    errors = future.result() or [None] * len(occasion_ids)
+                except Exception as error:
+                    errors = [error] * len(occasion_ids)
+
+                for occasion_id, error in zip(occasion_ids, errors):
+                    if error is not None:
+                        app.logger.error(
+                            "Could not deliver occasion %s", occasion_id, exc_info=error
+                        )
+                        history.record([occasion_id], "FAILED", error=repr(error))
+                        metrics.increment("deliveries.failed")
+                        continue
+
+                    history.record([occasion_id], "DELIVERED")
+                    metrics.increment("deliveries.delivered")
+                    delivered += 1
+
+            after = (deliveries[-1].next_fire_at, deliveries[-1].occasion_id)
+
+            # Pace the batches so no more than rate messages are sent per second
+            submitted += len(payloads)
+            delay = submitted / rate - (time.monotonic() - start) if rate else 0
+
+            # Release the claims of the sent batches before pausing
+            if delay > 0 or history.due():
+                history.flush()
+
+            if delay > 0:
+                if stop is not None:
+                    stop.wait(delay)
+                else:
+                    time.sleep(delay)
+
+    return delivered
+
+
+def deliver_due(now=None, stop=None):
+    """
+    Deliver every occasion that is due.
+
+    Args:
+    - now: The time to deliver up to, defaults to the current time.
+    - stop: An optional threading.Event, no new batch is claimed once it is set.
+
+    Returns:
+    - delivered: The number of occasions delivered.
+    """
+
+    now = now or datetime.now(timezone.utc)
+    return deliver_claimed(
+        lambda limit, after: due_occasions(now, limit, after), stop=stop
+    )
+
+
+def deliver_due_occasions():
+    """Scheduled job that delivers all due occasions."""
+
+    with scheduler.app.app_context():
+        return deliver_due()
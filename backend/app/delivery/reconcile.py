@@ -0,0 +1,141 @@
+"""
+reconcile.py
+
+This file contains the reconciliation of missed deliveries. The delivery scanner leaves
+alone occasions that became due longer than DELIVERY_MISFIRE_GRACE_TIME seconds ago, so
+anything that was due while no process was delivering, for instance during an outage or a
+deployment, would never be sent. When the scheduler starts in the elected leader, a
+reconciliation pass finds these occasions with a single anti-join against the delivered
+history entries and replays them through the delivery engine, throttled to
+DELIVERY_RECONCILE_RATE emails per second on the replay lane of the delivery executor, so
+the backlog does not starve current sends.
+
+Occasions missed by more than DELIVERY_RECONCILE_MAX_AGE seconds are not replayed: repeated
+occasions move on to their next anniversary, one-off occasions stay where they are.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from app import db, scheduler
+from app.delivery.metrics import metrics
+from app.delivery.queue import deliver_claimed, delivery_channels
+from app.delivery.recurrence import next_occurrence
+from app.events import reschedule
+from app.models import DeliveryHistory, Occasion
+from flask import current_app
+
+
+def missed_occasions(before, since, batch_size, after=None):
+    """
+    Build the query claiming the next batch of missed occasions.
+
+    An occasion is missed when its next_fire_at lies between since and before and it has no
+    DELIVERED history entry since then. Like due_occasions, the batch is ordered by
+    (next_fire_at, id), paged with a keyset, and claimed with FOR UPDATE SKIP LOCKED.
+
+    Args:
+    - before: The end of the reconciled window, where the delivery scanner takes over.
+    - since: The start of the reconciled window.
+    - batch_size: The maximum number of occasions to select.
+    - after: The (next_fire_at, id) of the last occasion of the previous batch, if any.
+
+    Returns:
+    - query: The select statement for the batch, returning Delivery rows.
+    """
+
+    delivered = sa.select(DeliveryHistory.id).where(
+        DeliveryHistory.occasion_id == Occasion.id,
+        DeliveryHistory.status == "DELIVERED",
+        DeliveryHistory.timestamp >= Occasion.next_fire_at,
+    )
+    query = (
+        sa.select(Occasion.id, Occasion.next_fire_at)
+        .where(
+            sa.func.lower(Occasion.delivery_method).in_(delivery_channels()),
+            Occasion.next_fire_at > since,
+            Occasion.next_fire_at <= before,
+            ~delivered.exists(),
+        )
+        .order_by(Occasion.next_fire_at, Occasion.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=Occasion)
+    )
+
+    if after is not None:
+        query = query.where(sa.tuple_(Occasion.next_fire_at, Occasion.id) > after)
+
+    return query
+
+
+def skip_expired(since, after):
+    """
+    Move repeated occasions missed before since to their next anniversary after after.
+
+    Returns:
+    - skipped: The number of occasions moved.
+    """
+
+    occasions = db.session.execute(
+        sa.select(Occasion.id, Occasion.date_time).where(
+            Occasion.is_repeated, Occasion.next_fire_at <= since
+        )
+    ).all()
+    reschedule(
+        {
+            occasion.id: next_occurrence(occasion.date_time, after)
+            for occasion in occasions
+        }
+    )
+    db.session.commit()
+
+    return len(occasions)
+
+
+def reconcile(now=None, stop=None):
+    """
+    Replay the deliveries missed while no process was delivering.
+
+    Args:
+    - now: The time of the reconciliation, defaults to the current time.
+    - stop: An optional threading.Event, no new batch is claimed once it is set.
+
+    Returns:
+    - recovered: The number of missed occasions delivered.
+    """
+
+    now = now or datetime.now(timezone.utc)
+    config = current_app.config
+    before = now - timedelta(seconds=config["DELIVERY_MISFIRE_GRACE_TIME"])
+    since = now - timedelta(seconds=config["DELIVERY_RECONCILE_MAX_AGE"])
+    start = time.monotonic()
+
+    recovered = deliver_claimed(
+        lambda limit, after: missed_occasions(before, since, limit, after),
+        stop=stop,
+        rate=config["DELIVERY_RECONCILE_RATE"],
+        lane="replay",
+    )
+    elapsed = time.monotonic() - start
+    skipped = skip_expired(since, before)
+
+    metrics.increment("deliveries.recovered", recovered)
+    metrics.observe("reconcile.duration", elapsed)
+    current_app.logger.info(
+        "Recovered %d missed deliveries in %.1f s (%.1f deliveries/s), "
+        "moved %d expired repeated occasions to their next anniversary",
+        recovered,
+        elapsed,
+        recovered / elapsed if elapsed else 0,
+        skipped,
+    )
+
+    return recovered
+
+
+def reconcile_missed_occasions():
+    """Scheduled job that replays the deliveries missed before the scheduler started."""
+
+    with scheduler.app.app_context():
+        return reconcile()
@@ -0,0 +1,80 @@
+"""
+recurrence.py
+
+This file contains the recurrence rules of occasions. Every occasion keeps the next time its
+message is due in the indexed next_fire_at column: the date and time of the occasion for a
+one-off message, and its next yearly anniversary for a repeated one. After a successful
+delivery a repeated occasion moves forward by one year and a one-off occasion leaves the
+queue, so the scanner only ever runs a range query on next_fire_at.
+
+Anniversaries are always computed from the original date and time of the occasion, so an
+occasion on February 29 is delivered on February 28 in common years and on February 29
+again in leap years.
+"""
+
+
+def add_years(date_time, years):
+    """
+    Move a date and time by a number of years.
+
+    Args:
+    - date_time: The date and time to move.
+    - years: The number of years to add.
+
+    Returns:
+    - date_time: The moved date and time, February 29 becomes February 28 in common years.
+    """
+
+    try:
+        return date_time.replace(year=date_time.year + years)
+    except ValueError:
+        return date_time.replace(year=date_time.year + years, day=28)
+
+
+def next_occurrence(date_time, after):
+    """
+    Find the first yearly anniversary of a date and time strictly after a given time.
+
+    Args:
+    - date_time: The original date and time of the occasion.
+    - after: The time the anniversary must follow.
+
+    Returns:
+    - occurrence: The first anniversary later than after.
+    """
+
+    if date_time > after:
+        return date_time
+
+    # Compare years in the time zone of the occasion
+    if date_time.tzinfo is not None and after.tzinfo is not None:
+        after = after.astimezone(date_time.tzinfo)
+
+    years = max(0, after.year - date_time.year - 1)
+    occurrence = add_years(date_time, years)
+
+    while occurrence <= after:
+        years += 1
+        occurrence = add_years(date_time, years)
+
+    return occurrence
+
+
+def first_fire_at(date_time, is_repeated, after):
+    """
+    Compute the next_fire_at of a newly created or updated occasion.
+
+    Args:
+    - date_time: The date and time of the occasion.
+    - is_repeated: Whether the message is sent every year.
+    - after: The earliest time a repeated occasion may still fire, occasions in the past
+      are moved to their next anniversary after it.
+
+    Returns:
+    - next_fire_at: The next time the message of the occasion is due.
+    """
+
+    if not is_repeated:
+        return date_time
+
+    return next_occurrence(date_time, after)
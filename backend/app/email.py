@@ -1,19 +1,343 @@
 """
 email.py
 
-This file contains utility functions related to sending emails and scheduling email jobs
-using Flask-Mail and APScheduler. It also includes a function for sending a password reset
-email.
+This file contains utility functions related to sending emails with Flask-Mail and
+queueing occasion emails for the delivery scanner. It also includes a function for sending
+a password reset email.
+
+Emails are sent through a pool of open SMTP connections, so that the connect, TLS handshake
+and AUTH exchange of the mail server are paid once per connection instead of once per email.
+Before they are sent they go through a send-rate governor, which shapes the sends to the
+rate the mail provider and its per-sender quotas tolerate instead of tripping its throttling.
+
+Transactional emails, such as password resets, never queue behind the occasion emails:
+they have their own governor bucket and MAIL_POOL_RESERVED connections of the pool that
+only they can use.
 """
 
-from app import mail, scheduler
-from flask import current_app, render_template
-from flask_mail import Message
+import smtplib
+import threading
+import time
+from collections import deque
+
+from app import db, mail
+from app.delivery.executor import delivery_executor
+from app.delivery.metrics import metrics
+from app.delivery.mime import invalidate, stamp
+from app.models import DeliveryOutbox, Occasion
+from app.rendering import renderer
+from flask import current_app
+from flask_mail import Message, sanitize_address, sanitize_addresses
+
+
+class SMTPConnectionPool:
+    """
+    Pool of open SMTP connections shared by the threads sending emails.
+
+    Connections are opened with Flask-Mail's mail.connect() and reused for many messages.
+    A connection is replaced after MAIL_POOL_MAX_MESSAGES messages, connections left idle
+    for more than MAIL_POOL_IDLE_TIMEOUT seconds are closed instead of being reused, and a
+    message whose connection was dropped by the server is sent again on a new connection.
+    Transactional messages use a shared slot when one is free and one of the reserved
+    slots otherwise, so they never wait for the other messages.
+
+    Attributes:
+    - size: Maximum number of connections open at the same time.
+    - reserved: Number of those connections only transactional messages can use.
+    - max_messages: Number of messages sent on a connection before it is replaced.
+    - idle_timeout: Seconds after which an idle connection is considered stale.
+    """
+
+    def __init__(self):
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = None
+        self._reserved = None
+
+    def init_app(self, app):
+        """
+        Read the pool settings of the application and drop any open connection.
+
+        Raises:
+        - ValueError: If every connection of the pool is reserved.
+        """
+
+        if app.config["MAIL_POOL_RESERVED"] >= app.config["MAIL_POOL_SIZE"]:
+            raise ValueError("MAIL_POOL_RESERVED must be less than MAIL_POOL_SIZE")
+
+        self.close()
+        self.size = app.config["MAIL_POOL_SIZE"]
+        self.reserved = app.config["MAIL_POOL_RESERVED"]
+        self.max_messages = app.config["MAIL_POOL_MAX_MESSAGES"]
+        self.idle_timeout = app.config["MAIL_POOL_IDLE_TIMEOUT"]
+        self._slots = threading.BoundedSemaphore(self.size - self.reserved)
+        self._reserved = threading.BoundedSemaphore(self.reserved)
+
+    def send(self, message, transactional=False):
+        """
+        Send a message over a pooled connection.
+
+        Must be called within an application context.
+
+        Args:
+        - message: The Flask-Mail Message instance to send.
+        - transactional: Whether the message may use the reserved connections.
+        """
+
+        self._send(lambda connection: connection.send(message), transactional)
+
+    def send_raw(self, sender, recipients, data):
+        """
+        Send pre-built message bytes over a pooled connection, see app/delivery/mime.py.
+
+        Must be called within an application context.
+
+        Args:
+        - sender: The sender's email address.
+        - recipients: List of recipient email addresses.
+        - data: The MIME message bytes.
+        """
+
+        def send(connection):
+            if connection.host:
+                connection.host.sendmail(
+                    sanitize_address(sender), list(sanitize_addresses(recipients)), data
+                )
+            connection.num_emails += 1
+
+        self._send(send)
+
+    def _send(self, send, transactional=False):
+        """Call send with a pooled connection, retrying once on a dropped connection."""
+
+        slots = self._slots
+
+        if transactional and self.reserved:
+            if not slots.acquire(blocking=False):
+                slots = self._reserved
+                slots.acquire()
+        else:
+            slots.acquire()
 
+        try:
+            connection = self._checkout()
 
-def send_email(app, subject, sender, recipients, text_body, html_body):
+            try:
+                send(connection)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._discard(connection)
+                connection = self._open()
+                try:
+                    send(connection)
+                except Exception:
+                    self._discard(connection)
+                    raise
+            except Exception:
+                self._discard(connection)
+                raise
+
+            self._checkin(connection)
+        finally:
+            slots.release()
+
+    def close(self):
+        """Close every idle connection of the pool."""
+
+        with self._lock:
+            connections = [connection for connection, _ in self._idle]
+            self._idle.clear()
+
+        for connection in connections:
+            self._discard(connection)
+
+    def _checkout(self):
+        """Take a fresh idle connection from the pool or open a new one."""
+
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+
+            if time.monotonic() - last_used < self.idle_timeout:
+                return connection
+
+            self._discard(connection)
+
+        return self._open()
+
+    def _checkin(self, connection):
+        """Give a connection back to the pool, closing it once it has sent enough messages."""
+
+        if connection.num_emails >= self.max_messages:
+            self._discard(connection)
+            return
+
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def _open(self):
+        connection = mail.connect()
+        connection.__enter__()
+        return connection
+
+    def _discard(self, connection):
+        try:
+            connection.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+
+
+smtp_pool = SMTPConnectionPool()
+
+
+class TokenBucket:
     """
-    Send an email with both text and HTML bodies.
+    Token bucket refilled at a constant rate.
+
+    Callers reserve a token even when the bucket is empty and wait until their token is
+    refilled, so waiting callers are served in order at exactly the bucket rate.
+
+    Attributes:
+    - rate: Tokens added per second.
+    - burst: Maximum number of tokens in the bucket.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def reserve(self, now):
+        """Take a token. Returns the number of seconds to wait before using it."""
+
+        self.refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self, now):
+        self.refill(now)
+        return self.tokens >= self.burst
+
+
+class SendRateGovernor:
+    """
+    Token buckets limiting the rate of emails sent to the mail provider and per sender.
+
+    Transactional emails skip the provider and sender buckets, whose reservations the
+    occasion emails can push minutes ahead, and go through a bucket of their own instead.
+
+    Attributes:
+    - provider: The mail server the provider bucket applies to.
+    - rate: Emails per minute accepted by the provider, unlimited if 0.
+    - burst: Emails the provider accepts at once before the rate applies.
+    - sender_rate: Emails per minute accepted per sender address, unlimited if 0.
+    - sender_burst: Emails a sender can send at once before the sender rate applies.
+    - transactional_rate: Transactional emails per minute, unlimited if 0.
+    - transactional_burst: Transactional emails sent at once before their rate applies.
+    """
+
+    # Number of sender buckets kept before full ones are dropped
+    max_senders = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._provider = None
+        self._transactional = None
+        self._senders = {}
+
+    def init_app(self, app):
+        """Read the rate limits from the application settings."""
+
+        config = app.config
+        self.provider = config.get("MAIL_SERVER")
+        self.rate = config["MAIL_RATE_LIMIT"]
+        self.burst = config["MAIL_RATE_BURST"]
+        self.sender_rate = config["MAIL_SENDER_RATE_LIMIT"]
+        self.sender_burst = config["MAIL_SENDER_RATE_BURST"]
+        self.transactional_rate = config["MAIL_TRANSACTIONAL_RATE_LIMIT"]
+        self.transactional_burst = config["MAIL_TRANSACTIONAL_RATE_BURST"]
+        self._provider = None
+        self._transactional = None
+        self._senders = {}
+
+        if self.rate:
+            self._provider = TokenBucket(self.rate / 60, self.burst)
+
+        if self.transactional_rate:
+            self._transactional = TokenBucket(
+                self.transactional_rate / 60, self.transactional_burst
+            )
+
+    def acquire(self, sender, transactional=False):
+        """
+        Block until an email from sender may be sent.
+
+        Args:
+        - sender: The sender's email address.
+        - transactional: Whether the email goes through the transactional bucket.
+
+        Returns:
+        - wait: The number of seconds the caller was throttled.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+
+            if transactional:
+                if self._transactional is not None:
+                    wait = self._transactional.reserve(now)
+            else:
+                if self._provider is not None:
+                    wait = self._provider.reserve(now)
+
+                if self.sender_rate:
+                    wait = max(wait, self._sender_bucket(sender, now).reserve(now))
+
+        if wait > 0:
+            metrics.increment("mail.throttled")
+            metrics.observe("mail.throttle_wait", wait)
+            time.sleep(wait)
+
+        return wait
+
+    def _sender_bucket(self, sender, now):
+        bucket = self._senders.get(sender)
+
+        if bucket is None:
+            if len(self._senders) >= self.max_senders:
+                self._senders = {
+                    key: value
+                    for key, value in self._senders.items()
+                    if not value.is_full(now)
+                }
+            bucket = self._senders[sender] = TokenBucket(
+                self.sender_rate / 60, self.sender_burst
+            )
+
+        return bucket
+
+
+send_governor = SendRateGovernor()
+
+
+def send_email(
+    app, subject, sender, recipients, text_body, html_body, transactional=False
+):
+    """
+    Send an email with both text and HTML bodies over a pooled SMTP connection.
+
+    Blocks while the send-rate governor throttles the sender or the mail provider, or the
+    transactional emails if transactional is True.
 
     Args:
     - app: The Flask application instance.
@@ -22,77 +346,116 @@ def send_email(app, subject, sender, recipients, text_body, html_body):
     - recipients: List of recipient email addresses.
     - text_body: The plain text body of the email.
     - html_body: The HTML body of the email.
+    - transactional: Whether the email is sent with the transactional reservations.
     """
 
+    send_governor.acquire(sender, transactional)
+
     with app.app_context():
         msg = Message(subject=subject, sender=sender, recipients=recipients)
         msg.body = text_body
         msg.html = html_body
-        mail.send(msg)
+        smtp_pool.send(msg, transactional)
+
+
+def send_mime(app, sender, recipients, data):
+    """
+    Send a cached MIME message over a pooled SMTP connection, see app/delivery/mime.py.
+
+    Blocks while the send-rate governor throttles the sender or the mail provider.
+
+    Args:
+    - app: The Flask application instance.
+    - sender: The sender's email address.
+    - recipients: List of recipient email addresses.
+    - data: The cached message bytes, without their Date and Message-ID headers.
+    """
+
+    send_governor.acquire(sender)
+
+    with app.app_context():
+        smtp_pool.send_raw(sender, recipients, stamp(data))
 
 
 def send_password_reset_email(token, user):
     """
     Send a password reset email to a user.
 
+    The email is rendered right away, since its links are built from the current request,
+    and sent on the transactional lane of the delivery executor so the request does not
+    wait for the SMTP exchange and a busy delivery scan does not delay it. It also skips
+    the governor buckets and pool connections of the occasion emails. Its latency,
+    from this call until the email is sent, is recorded in the transactional.latency
+    metric.
+
     Args:
     - token: The password reset token.
     - user: The user to whom the email is sent.
+
+    Returns:
+    - future: A Future representing the sending of the email.
+
+    Raises:
+    - LaneFull: If the transactional lane stayed full for MAIL_TRANSACTIONAL_QUEUE_TIMEOUT
+      seconds.
     """
 
-    token = token
-    send_email(
-        app=current_app,
-        subject="Memorable Messages Reset Your Password",
-        sender=current_app.config["ADMINS"][0],
-        recipients=[user.email],
-        text_body=render_template("email/reset_password.txt", user=user, token=token),
-        html_body=render_template("email/reset_password.html", user=user, token=token),
+    app = current_app._get_current_object()
+    queued_at = time.monotonic()
+    email = {
+        "app": app,
+        "subject": "Memorable Messages Reset Your Password",
+        "sender": app.config["ADMINS"][0],
+        "recipients": [user.email],
+        "text_body": renderer.render(
+            "email/reset_password.txt", user=user, token=token
+        ),
+        "html_body": renderer.render(
+            "email/reset_password.html", user=user, token=token
+        ),
+        "transactional": True,
+    }
+
+    def send():
+        try:
+            send_email(**email)
+        except Exception:
+            app.logger.exception("Could not send the password reset email")
+            metrics.increment("transactional.failed")
+            raise
+
+        metrics.observe("transactional.latency", time.monotonic() - queued_at)
+
+    # Never hold the request thread for long if the lane is backed up
+    return delivery_executor.submit(
+        send,
+        lane="transactional",
+        timeout=app.config["MAIL_TRANSACTIONAL_QUEUE_TIMEOUT"],
     )
 
 
 def schedule_email(occasion, action="CREATE"):
     """
-    Schedule or update an email job based on the occasion's details and action.
+    Queue, reschedule or cancel the message of an occasion, sent by email or SMS.
+
+    The occasions table is the delivery queue, so a deleted occasion leaves the queue
+    together with its row. A created or updated occasion is parked and a delivery outbox
+    entry is added in the same transaction; the outbox relay then arms it for its date and
+    time, or for its next anniversary if it is repeated and its date is past, so its
+    details are sent even if an earlier version was already delivered. An updated occasion
+    also gets a new version and loses its cached MIME message, the relay builds a new one.
+    The caller commits the session.
 
     Args:
     - occasion: The Occasion model instance representing the scheduled email.
     - action: The action to perform (CREATE, UPDATE, DELETE).
     """
 
-    job_id = str(occasion.id)
-
-    if action == "UPDATE" and scheduler.get_job(job_id) is not None:
-        scheduler.modify_job(
-            func=send_email,
-            trigger="date",
-            run_date=occasion.date_time,
-            args=[
-                current_app._get_current_object(),
-                occasion.occasion_type,
-                occasion.user.email,
-                [occasion.receiver_email],
-                occasion.message_content,
-                occasion.message_content,
-            ],
-            id=job_id,
-            misfire_grace_time=86400,
-        )
-    elif action == "DELETE" and scheduler.get_job(job_id) is not None:
-        scheduler.remove_job(id=job_id)
-    else:
-        scheduler.add_job(
-            func=send_email,
-            trigger="date",
-            run_date=occasion.date_time,
-            args=[
-                current_app._get_current_object(),
-                occasion.occasion_type,
-                occasion.user.email,
-                [occasion.receiver_email],
-                occasion.message_content,
-                occasion.message_content,
-            ],
-            id=job_id,
-            misfire_grace_time=86400,
-        )
+    if action in ("CREATE", "UPDATE"):
+        occasion.next_fire_at = None
+        db.session.add(DeliveryOutbox(occasion=occasion))
+
+    if action == "UPDATE":
+        # Incremented in SQL, so concurrent updates never overwrite each other's version
+        occasion.version = Occasion.version + 1
+        invalidate(occasion)
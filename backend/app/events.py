@@ -2,28 +2,261 @@
 events.py
 
 This file contains event-related functionality for the Memorable Messages Web Application.
-In particular, it includes an event listener for the APScheduler, which updates the delivery
-status of occasions after they have been executed.
+In particular, it records the outcome of a delivery: once the delivery queue has sent the
+messages of a batch of occasions, the occasions are marked as delivered and their delivery
+history entries are added in the transaction holding the claim on the batch.
+
+A failed delivery is recorded too. Instead of being retried right away by the thread that
+sent it, it is put back in the queue with a later next_fire_at, following a jittered
+exponential backoff, and it moves to the dead letters after DELIVERY_MAX_ATTEMPTS attempts.
+
+During peaks the statuses are buffered by a HistoryWriter and written with one multi-row
+insert every DELIVERY_HISTORY_FLUSH_SIZE records or DELIVERY_HISTORY_FLUSH_INTERVAL
+milliseconds, so a burst of deliveries is recorded in a handful of transactions instead
+of one per batch.
 """
 
-from app import db, scheduler
-from app.models import DeliveryHistory
-from apscheduler.events import EVENT_JOB_EXECUTED
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from app import db
+from app.delivery.metrics import metrics
+from app.delivery.recurrence import next_occurrence
+from app.models import DeadLetter, DeliveryHistory, Occasion
+from flask import current_app
+
+
+def reschedule(next_fire_ats, **values):
+    """
+    Set the next_fire_at of many occasions with one UPDATE ... FROM (VALUES ...).
+    The caller is responsible for committing the database session.
+
+    Args:
+    - next_fire_ats: The new next_fire_at of each occasion, keyed by occasion id.
+    - values: Other columns to set on all the occasions.
+    """
+
+    if not next_fire_ats:
+        return
+
+    fires = sa.values(
+        sa.column("id", sa.Integer),
+        sa.column("next_fire_at", sa.DateTime(timezone=True)),
+        name="fires",
+    ).data(list(next_fire_ats.items()))
+
+    db.session.execute(
+        sa.update(Occasion)
+        .where(Occasion.id == fires.c.id)
+        .values(
+            next_fire_at=sa.cast(fires.c.next_fire_at, sa.DateTime(timezone=True)),
+            **values,
+        )
+    )
 
 
-def update_status(event):
-    """Event listener function triggered when a scheduled job is executed.
-    It updates the delivery status of the associated occasion to "DELIVERED" in the database.
+def retry_delay(attempt, base, cap):
     """
+    Compute the delay before retrying a failed delivery, with exponential backoff.
+
+    Half of the delay is random so that deliveries which failed together, for instance
+    while the SMTP relay was down, do not all retry at the same moment.
+
+    Args:
+    - attempt: The number of the attempt that failed, starting at 1.
+    - base: The delay in seconds after the first failed attempt.
+    - cap: The maximum delay in seconds.
+
+    Returns:
+    - delay: The delay as a timedelta.
+    """
+
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return timedelta(seconds=delay / 2 + random.uniform(0, delay / 2))
+
+
+def update_status(occasion_ids, status, errors=None):
+    """Record the delivery status of a batch of occasions.
+    Delivered occasions move to their next anniversary if they are repeated and leave the
+    delivery queue otherwise. Failed occasions are retried with exponential backoff, and
+    move to the dead letters once they failed DELIVERY_MAX_ATTEMPTS times.
+    The caller is responsible for committing the database session.
+    """
+
+    if not occasion_ids:
+        return
+
+    config = current_app.config
+    errors = errors or {}
+    now = datetime.now(timezone.utc)
+    occasions = db.session.execute(
+        sa.select(
+            Occasion.id,
+            Occasion.date_time,
+            Occasion.is_repeated,
+            Occasion.next_fire_at,
+            Occasion.attempts,
+        ).where(Occasion.id.in_(occasion_ids))
+    ).all()
+
+    def next_anniversary(occasion):
+        if not occasion.is_repeated:
+            return None
+        return next_occurrence(occasion.date_time, max(occasion.next_fire_at, now))
+
+    if status == "DELIVERED":
+        reschedule(
+            {occasion.id: next_anniversary(occasion) for occasion in occasions},
+            delivered_at=now,
+            attempts=0,
+        )
+    elif status == "FAILED":
+        retries = {}
+        dead_letters = []
+
+        for occasion in occasions:
+            attempt = occasion.attempts + 1
+            if attempt < config["DELIVERY_MAX_ATTEMPTS"]:
+                retries[occasion.id] = now + retry_delay(
+                    attempt,
+                    config["DELIVERY_RETRY_BACKOFF"],
+                    config["DELIVERY_RETRY_BACKOFF_MAX"],
+                )
+            else:
+                dead_letters.append(occasion)
+
+        reschedule(retries, attempts=Occasion.attempts + 1)
+        reschedule(
+            {occasion.id: next_anniversary(occasion) for occasion in dead_letters},
+            attempts=0,
+        )
+
+        if dead_letters:
+            db.session.execute(
+                sa.insert(DeadLetter),
+                [
+                    {
+                        "occasion_id": occasion.id,
+                        "attempts": occasion.attempts + 1,
+                        "error": errors.get(occasion.id),
+                    }
+                    for occasion in dead_letters
+                ],
+            )
+            metrics.increment("deliveries.dead_lettered", len(dead_letters))
+
+    db.session.execute(
+        sa.insert(DeliveryHistory),
+        [
+            {
+                "occasion_id": occasion.id,
+                "status": status,
+                "attempt": occasion.attempts + 1,
+            }
+            for occasion in occasions
+        ],
+    )
+
+
+def redrive(dead_letter_ids=None):
+    """
+    Put dead-lettered deliveries back in the delivery queue, to be sent right away.
+    The caller is responsible for committing the database session.
+
+    Args:
+    - dead_letter_ids: The ids of the dead letters to redrive, all of them if None.
+
+    Returns:
+    - redriven: The number of occasions put back in the queue.
+    """
+
+    condition = sa.true()
+    if dead_letter_ids is not None:
+        condition = DeadLetter.id.in_(dead_letter_ids)
+
+    result = db.session.execute(
+        sa.update(Occasion)
+        .where(Occasion.id.in_(sa.select(DeadLetter.occasion_id).where(condition)))
+        .values(next_fire_at=datetime.now(timezone.utc), attempts=0)
+    )
+    db.session.execute(sa.delete(DeadLetter).where(condition))
+
+    return result.rowcount
+
+
+class HistoryWriter:
+    """
+    Buffer of delivery statuses flushed to the database in bulk.
+
+    Flushing commits the database session, which also releases the claims of the batches
+    recorded so far. It must therefore only be called once the buffered deliveries have
+    been sent, and the writer flushes whatever is left when its with block exits, even on
+    error or shutdown, so no sent delivery goes unrecorded.
+
+    Attributes:
+    - flush_size: Number of buffered records that triggers a flush.
+    - flush_interval: Milliseconds after the first buffered record that trigger a flush.
+    """
+
+    def __init__(self, flush_size, flush_interval):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._records = defaultdict(list)
+        self._errors = {}
+        self._count = 0
+        self._since = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def record(self, occasion_ids, status, error=None):
+        """Buffer the delivery status of a batch of occasions, with the error if it failed."""
+
+        if not occasion_ids:
+            return
+
+        if self._since is None:
+            self._since = time.monotonic()
+
+        self._records[status].extend(occasion_ids)
+        if error is not None:
+            self._errors.update(dict.fromkeys(occasion_ids, error))
+        self._count += len(occasion_ids)
+
+    def due(self):
+        """Return True when the buffer is full or its oldest record is too old."""
+
+        if self._since is None:
+            return False
+
+        age = (time.monotonic() - self._since) * 1000
+        return self._count >= self.flush_size or age >= self.flush_interval
+
+    def flush(self):
+        """Write the buffered statuses and commit the database session."""
 
-    with scheduler.app.app_context():
-        occasion_id = int(event.job_id)
-        delivery_history = DeliveryHistory()
-        delivery_history.occasion_id = occasion_id
-        delivery_history.status = "DELIVERED"
+        start = time.monotonic()
 
-        db.session.add(delivery_history)
+        for status, occasion_ids in self._records.items():
+            update_status(occasion_ids, status, self._errors)
         db.session.commit()
 
+        if self._count:
+            metrics.increment("history.flushes")
+            metrics.increment("history.records", self._count)
+            metrics.observe("history.flush", time.monotonic() - start)
 
-scheduler.add_listener(update_status, EVENT_JOB_EXECUTED)
+        self._records.clear()
+        self._errors.clear()
+        self._count = 0
+        self._since = None
@@ -113,11 +113,16 @@ class Occasion(db.Model):
     - message_content: Content of the message.
     - is_repeated: Flag indicating if the message should be repeated yearly.
     - date_time: Date and time of the occasion.
+    - next_fire_at: Next date and time the message is due, None once a one-off message is delivered.
+    - delivered_at: Timestamp indicating when the message was last delivered, if it has been.
+    - version: Version of the message of the occasion, incremented by schedule_email on UPDATE.
+    - attempts: Number of failed delivery attempts for the current next_fire_at.
     - receiver_email: Email address of the message recipient.
     - receiver_phone: Phone number of the message recipient.
     - created_at: Timestamp indicating when the occasion was created.
     - user: Relationship with the User model.
     - delivery_histories: Relationship with the DeliveryHistory model.
+    - dead_letters: Relationship with the DeadLetter model.
     """
 
     __tablename__ = "occasions"
@@ -131,6 +136,14 @@ class Occasion(db.Model):
     message_content: so.Mapped[str] = so.mapped_column(sa.Text())
     is_repeated: so.Mapped[bool] = so.mapped_column(server_default=sa.text("false"))
     date_time: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True))
+    next_fire_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True), index=True
+    )
+    delivered_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True)
+    )
+    version: so.Mapped[int] = so.mapped_column(server_default=sa.text("1"))
+    attempts: so.Mapped[int] = so.mapped_column(server_default=sa.text("0"))
     receiver_email: so.Mapped[Optional[str]] = so.mapped_column(sa.String(120))
     receiver_phone: so.Mapped[Optional[str]] = so.mapped_column(sa.String(15))
     created_at: so.Mapped[datetime] = so.mapped_column(
@@ -141,29 +154,40 @@ class Occasion(db.Model):
     delivery_histories: so.WriteOnlyMapped["DeliveryHistory"] = so.relationship(
         back_populates="occasion", passive_deletes=True, cascade="all, delete-orphan"
     )
+    dead_letters: so.WriteOnlyMapped["DeadLetter"] = so.relationship(
+        back_populates="occasion", passive_deletes=True, cascade="all, delete-orphan"
+    )
 
     def __repr__(self):
         return f"<Occasion {self.occasion_type}>"
 
-    def to_dict(self, include_message_content=False):
-        """Convert the occasion object to a dictionary."""
+    # Fields returned by to_dict, in order, message_content only when asked for
+    FIELDS = (
+        "id",
+        "user_id",
+        "delivery_method",
+        "occasion_type",
+        "is_repeated",
+        "date_time",
+        "receiver_email",
+        "receiver_phone",
+        "created_at",
+        "message_content",
+    )
 
-        data = {
-            "id": self.id,
-            "user_id": self.user_id,
-            "delivery_method": self.delivery_method,
-            "occasion_type": self.occasion_type,
-            "is_repeated": self.is_repeated,
-            "date_time": self.date_time,
-            "receiver_email": self.receiver_email,
-            "receiver_phone": self.receiver_phone,
-            "created_at": self.created_at,
-        }
+    @classmethod
+    def load_only(cls, fields):
+        """Loader option loading only the columns of the given fields."""
 
-        if include_message_content:
-            data["message_content"] = self.message_content
+        return so.load_only(*(getattr(cls, field) for field in fields))
 
-        return data
+    def to_dict(self, include_message_content=False, fields=None):
+        """Convert the occasion object to a dictionary, restricted to fields if given."""
+
+        if fields is None:
+            fields = self.FIELDS if include_message_content else self.FIELDS[:-1]
+
+        return {field: getattr(self, field) for field in fields}
 
     def from_dict(self, data):
         """Populate occasion fields from a dictionary."""
@@ -189,18 +213,29 @@ class DeliveryHistory(db.Model):
     Attributes:
     - id: Unique identifier for the delivery history.
     - occasion_id: Foreign key referencing the occasion associated with the delivery history.
-    - status: Status of the delivery (e.g., delivered, pending).
+    - status: Status of the delivery (e.g., delivered, failed).
+    - attempt: Number of the delivery attempt the status was recorded for.
     - timestamp: Timestamp indicating when the delivery status was recorded.
     - occasion: Relationship with the Occasion model.
+
+    The (timestamp, id) index serves the time-range pages of GET /delivery-histories, the
+    (occasion_id, timestamp) index the histories of an occasion.
     """
 
     __tablename__ = "delivery_histories"
+    __table_args__ = (
+        sa.Index("ix_delivery_histories_timestamp_id", "timestamp", "id"),
+        sa.Index(
+            "ix_delivery_histories_occasion_id_timestamp", "occasion_id", "timestamp"
+        ),
+    )
 
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     occasion_id: so.Mapped[int] = so.mapped_column(
         sa.ForeignKey(Occasion.id, ondelete="cascade")
     )
     status: so.Mapped[str] = so.mapped_column(sa.String(64))
+    attempt: so.Mapped[int] = so.mapped_column(server_default=sa.text("1"))
     timestamp: so.Mapped[datetime] = so.mapped_column(
         default=lambda: datetime.now(timezone.utc), type_=sa.DateTime(timezone=True)
     )
@@ -217,6 +252,7 @@ class DeliveryHistory(db.Model):
             "id": self.id,
             "occasion_id": self.occasion_id,
             "status": self.status,
+            "attempt": self.attempt,
             "timestamp": self.timestamp,
         }
 
@@ -230,3 +266,109 @@ class DeliveryHistory(db.Model):
                 setattr(self, field, data[field])
 
         return data
+
+
+class DeadLetter(db.Model):
+    """
+    DeadLetter model representing a delivery that failed DELIVERY_MAX_ATTEMPTS times.
+
+    Attributes:
+    - id: Unique identifier for the dead letter.
+    - occasion_id: Foreign key referencing the occasion that could not be delivered.
+    - attempts: Number of delivery attempts made.
+    - error: Error raised by the last delivery attempt.
+    - created_at: Timestamp indicating when the delivery was given up.
+    - occasion: Relationship with the Occasion model.
+    """
+
+    __tablename__ = "dead_letters"
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    occasion_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(Occasion.id, ondelete="cascade"), index=True
+    )
+    attempts: so.Mapped[int]
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text())
+    created_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), type_=sa.DateTime(timezone=True)
+    )
+
+    occasion: so.Mapped[Occasion] = so.relationship(back_populates="dead_letters")
+
+    def __repr__(self):
+        return f"<DeadLetter {self.occasion_id}>"
+
+    def to_dict(self):
+        """Convert the dead letter object to a dictionary."""
+
+        data = {
+            "id": self.id,
+            "occasion_id": self.occasion_id,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at,
+        }
+
+        return data
+
+
+class DeliveryOutbox(db.Model):
+    """
+    DeliveryOutbox model representing a change of an occasion not yet applied to the delivery queue.
+
+    Entries are written in the transaction changing the occasion and applied by the outbox
+    relay, see app/delivery/outbox.py.
+
+    Attributes:
+    - id: Unique identifier for the outbox entry.
+    - occasion_id: Foreign key referencing the changed occasion.
+    - created_at: Timestamp indicating when the occasion was changed.
+    - occasion: Relationship with the Occasion model.
+    """
+
+    __tablename__ = "delivery_outbox"
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    occasion_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(Occasion.id, ondelete="cascade"), index=True
+    )
+    created_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), type_=sa.DateTime(timezone=True)
+    )
+
+    occasion: so.Mapped[Occasion] = so.relationship()
+
+    def __repr__(self):
+        return f"<DeliveryOutbox {self.occasion_id}>"
+
+
+class MessageCache(db.Model):
+    """
+    MessageCache model representing the pre-built MIME message of an occasion version.
+
+    Entries are built by the outbox relay when DELIVERY_MIME_CACHE is enabled and only used
+    while the occasion still has the same version and its user the same email address, see
+    app/delivery/mime.py.
+
+    Attributes:
+    - occasion_id: Foreign key referencing the occasion the message was built for.
+    - version: Version of the occasion the message was built from.
+    - sender: Email address of the sender the message was built for.
+    - data: The MIME message, without its Date and Message-ID headers.
+    - created_at: Timestamp indicating when the message was built.
+    """
+
+    __tablename__ = "message_cache"
+
+    occasion_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(Occasion.id, ondelete="cascade"), primary_key=True
+    )
+    version: so.Mapped[int]
+    sender: so.Mapped[str] = so.mapped_column(sa.String(120))
+    data: so.Mapped[bytes] = so.mapped_column(sa.LargeBinary())
+    created_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), type_=sa.DateTime(timezone=True)
+    )
+
+    def __repr__(self):
+        return f"<MessageCache {self.occasion_id} v{self.version}>"
@@ -0,0 +1,130 @@
+"""
+rendering.py
+
+This file contains the template renderer used for emails. Jinja templates are compiled once
+per process and the compiled objects are kept in memory, so rendering an email never looks
+the template up in the loader again or checks whether its source changed. Templates are
+only reloaded when the Jinja environment auto-reloads them, as in debug mode.
+
+Occasion messages are rendered from the shared email/occasion.txt and email/occasion.html
+wrapper templates. When many deliveries fire together, render_occasions renders a whole
+batch with one template lookup and one template context. Messages coalesced into one
+email are rendered together from email/coalesced.txt and email/coalesced.html.
+"""
+
+import threading
+import time
+
+from app.delivery.metrics import metrics
+from flask import current_app
+
+OCCASION_TEMPLATES = ("email/occasion.txt", "email/occasion.html")
+COALESCED_TEMPLATES = ("email/coalesced.txt", "email/coalesced.html")
+
+
+class TemplateRenderer:
+    """Render templates compiled once per process."""
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Drop the templates compiled for a previous application."""
+
+        with self._lock:
+            self._templates = {}
+
+    def get_template(self, name):
+        """
+        Return the compiled template with the given name, compiling it on first use.
+
+        Args:
+        - name: The name of the template, relative to the templates folder.
+
+        Returns:
+        - template: The compiled jinja2.Template.
+        """
+
+        jinja_env = current_app.jinja_env
+        if jinja_env.auto_reload:
+            return jinja_env.get_template(name)
+
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    template = jinja_env.get_template(name)
+                    self._templates[name] = template
+
+        return template
+
+    def render(self, name, **context):
+        """
+        Render a template with the given context, like flask.render_template.
+
+        Args:
+        - name: The name of the template.
+        - context: The variables available in the template.
+
+        Returns:
+        - rendered: The rendered template.
+        """
+
+        current_app.update_template_context(context)
+        return self.get_template(name).render(context)
+
+    def render_occasions(self, payloads):
+        """
+        Render the text and HTML bodies of a batch of occasion messages.
+
+        Args:
+        - payloads: The rows of the occasions to render, with an id, occasion_type,
+          message_content and sender.
+
+        Returns:
+        - bodies: The (text_body, html_body) of each occasion, keyed by occasion id.
+        """
+
+        start = time.perf_counter()
+        text, html = (self.get_template(name) for name in OCCASION_TEMPLATES)
+        context = {}
+        current_app.update_template_context(context)
+        bodies = {}
+
+        for payload in payloads:
+            context.update(
+                occasion_type=payload.occasion_type,
+                message_content=payload.message_content,
+                sender=payload.sender,
+            )
+            bodies[payload.id] = (text.render(context), html.render(context))
+
+        if bodies:
+            metrics.observe(
+                "render.message", (time.perf_counter() - start) / len(bodies)
+            )
+
+        return bodies
+
+    def render_coalesced(self, payloads):
+        """
+        Render the text and HTML bodies of one email combining several occasion messages.
+
+        Args:
+        - payloads: The rows of the occasions to combine, see render_occasions.
+
+        Returns:
+        - bodies: The (text_body, html_body) of the combined email.
+        """
+
+        context = {"messages": payloads}
+        current_app.update_template_context(context)
+
+        return tuple(
+            self.get_template(name).render(context) for name in COALESCED_TEMPLATES
+        )
+
+
+renderer = TemplateRenderer()
@@ -0,0 +1,317 @@
+"""
+sms.py
+
+This file contains the SMS delivery channel. Text messages are sent through a provider
+selected by the SMS_PROVIDER setting:
+
+- twilio: sends every text with a request to the Messages resource of the Twilio REST API,
+  over a pool of keep-alive HTTPS connections, so busy dates reuse a few connections
+  instead of opening one per text.
+- fake: keeps the texts in memory, for the tests and local development.
+
+Texts are handed to the provider in batches of up to SMS_BATCH_SIZE, one task of the
+delivery executor per batch. A provider with a bulk endpoint sends a batch with one
+request. The Twilio Messages resource takes one text per request, so the Twilio provider
+sends the texts of a batch one after the other on a single pooled connection.
+"""
+
+import base64
+import http.client
+import json
+import select
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlsplit
+
+from app.delivery.executor import delivery_executor
+from app.delivery.metrics import metrics
+
+SMS = namedtuple("SMS", ["to", "body"])
+
+
+class SMSError(Exception):
+    """Error returned by an SMS provider for a text."""
+
+
+class HTTPConnectionPool:
+    """
+    Pool of keep-alive HTTP connections to a single host.
+
+    An idle connection closed by the server is opened again before it is used, and so is a
+    connection the server asked to close. A request is written again on a new connection
+    only if it could not be written: once written, the server may have processed it even
+    if its response is lost, so it is never sent twice.
+
+    Attributes:
+    - size: Maximum number of connections open at the same time.
+    - timeout: Seconds to wait for the server before giving up a request.
+    """
+
+    def __init__(self, url, size, timeout):
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.host = parts.hostname
+        self.port = parts.port
+        self.size = size
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for a series of requests."""
+
+        with self._slots:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else self._open()
+
+            # The next request opens the connection again
+            if self._dropped(connection):
+                connection.close()
+
+            try:
+                yield connection
+            except BaseException:
+                connection.close()
+                raise
+
+            with self._lock:
+                self._idle.append(connection)
+
+    def request(self, connection, method, path, body, headers):
+        """
+        Send a request on a checked out connection and read its response.
+
+        Returns:
+        - response: A (status, body) tuple.
+
+        Raises:
+        - OSError, http.client.HTTPException: If the request or its response failed.
+        """
+
+        try:
+            connection.request(method, path, body=body, headers=headers)
+        except ConnectionError:
+            # The request was not fully written, so the server cannot have processed it
+            connection.close()
+            connection.request(method, path, body=body, headers=headers)
+
+        try:
+            response = connection.getresponse()
+            data = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        # The server closes the connection after this response
+        if response.will_close:
+            connection.close()
+
+        return response.status, data
+
+    def close(self):
+        """Close every idle connection of the pool."""
+
+        with self._lock:
+            connections = list(self._idle)
+            self._idle.clear()
+
+        for connection in connections:
+            connection.close()
+
+    def _dropped(self, connection):
+        """Whether the server closed an idle connection, which then reads as ready."""
+
+        if connection.sock is None:
+            return False
+
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+        return bool(readable)
+
+    def _open(self):
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+
+class TwilioProvider:
+    """
+    Send texts with the Messages resource of the Twilio REST API.
+
+    Attributes:
+    - from_number: The Twilio phone number the texts are sent from.
+    - pool: The pool of connections to the API.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, url, pool_size, timeout):
+        self.from_number = from_number
+        self.path = f"/2010-04-01/Accounts/{account_sid}/Messages.json"
+        credentials = base64.b64encode(f"{account_sid}:{auth_token}".encode())
+        self.headers = {
+            "Authorization": f"Basic {credentials.decode()}",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+        }
+        self.pool = HTTPConnectionPool(url, pool_size, timeout)
+
+    def send_batch(self, messages):
+        """
+        Send a batch of texts over one pooled connection.
+
+        A text that fails does not stop the batch, so the texts already accepted by the API
+        are never reported as failed and sent again.
+
+        Returns:
+        - errors: For every text, the error it failed with or None if it was accepted.
+        """
+
+        errors = []
+
+        with self.pool.connection() as connection:
+            for message in messages:
+                body = urlencode(
+                    {"To": message.to, "From": self.from_number, "Body": message.body}
+                )
+                try:
+                    status, data = self.pool.request(
+                        connection, "POST", self.path, body, self.headers
+                    )
+                except (OSError, http.client.HTTPException) as error:
+                    errors.append(error)
+                    continue
+
+                errors.append(None if status < 300 else self._error(status, data))
+
+        return errors
+
+    def close(self):
+        self.pool.close()
+
+    def _error(self, status, data):
+        try:
+            message = json.loads(data)["message"]
+        except (ValueError, KeyError, TypeError):
+            message = data.decode("utf-8", "replace")
+
+        return SMSError(f"{status}: {message}")
+
+
+class FakeSMSProvider:
+    """
+    Keep the texts in memory instead of sending them.
+
+    Attributes:
+    - outbox: The texts sent so far.
+    - batches: The number of batches sent so far.
+    - fail: Phone numbers the texts to which fail, for testing.
+    """
+
+    def __init__(self):
+        self.outbox = []
+        self.batches = 0
+        self.fail = set()
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        errors = [
+            (
+                SMSError(f"cannot send to {message.to}")
+                if message.to in self.fail
+                else None
+            )
+            for message in messages
+        ]
+
+        with self._lock:
+            self.batches += 1
+            self.outbox.extend(
+                message for message, error in zip(messages, errors) if error is None
+            )
+
+        return errors
+
+    def close(self):
+        pass
+
+
+class SMSChannel:
+    """
+    Send texts in batches on the threads of the delivery executor.
+
+    Attributes:
+    - provider: The SMS provider, None when SMS delivery is disabled.
+    - batch_size: Maximum number of texts handed to the provider at once.
+    """
+
+    def __init__(self):
+        self.provider = None
+
+    def init_app(self, app):
+        """Create the provider selected by the SMS_PROVIDER setting."""
+
+        self.close()
+        config = app.config
+        self.batch_size = config["SMS_BATCH_SIZE"]
+
+        if config["SMS_PROVIDER"] == "twilio":
+            self.provider = TwilioProvider(
+                config["TWILIO_ACCOUNT_SID"],
+                config["TWILIO_AUTH_TOKEN"],
+                config["TWILIO_FROM_NUMBER"],
+                config["TWILIO_API_URL"],
+                config["SMS_POOL_SIZE"],
+                config["SMS_TIMEOUT"],
+            )
+        elif config["SMS_PROVIDER"] == "fake":
+            self.provider = FakeSMSProvider()
+        else:
+            self.provider = None
+
+    @property
+    def enabled(self):
+        return self.provider is not None
+
+    def submit(self, messages, lane="scheduled"):
+        """
+        Schedule texts to be sent in batches.
+
+        Args:
+        - messages: The SMS to send.
+        - lane: The priority lane of the delivery executor the batches are sent on.
+
+        Returns:
+        - futures: The Future of every batch, mapped to the indexes of its texts in
+          messages. A Future resolves to the errors of the texts of its batch, see
+          TwilioProvider.send_batch.
+        """
+
+        futures = {}
+
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start : start + self.batch_size]
+            future = delivery_executor.submit(self._send_batch, batch, lane=lane)
+            futures[future] = range(start, start + len(batch))
+
+        return futures
+
+    def close(self):
+        """Close the connections of the provider."""
+
+        if self.provider is not None:
+            self.provider.close()
+
+    def _send_batch(self, messages):
+        start = time.monotonic()
+        errors = self.provider.send_batch(messages)
+        metrics.observe("sms.batch", time.monotonic() - start)
+        metrics.increment("sms.sent", errors.count(None))
+
+        return errors
+
+
+sms_channel = SMSChannel()
@@ -0,0 +1,17 @@
+"""
+__init__.py
+
+This package contains the benchmarks of the delivery engine and the local stand-in servers
+they send to. Run them from the backend directory, e.g. "python -m benchmarks.smtp_pool".
+"""
+
+from config import Config
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SCHEDULER_AUTOSTART = False
+    MAIL_SERVER = "127.0.0.1"
+    MAIL_USE_TLS = False
+    MAIL_USERNAME = None
+    MAIL_PASSWORD = None
@@ -0,0 +1,73 @@
+"""
+delivery_engines.py
+
+This file benchmarks the threaded delivery engine against the asyncio delivery engine by
+sending the same number of emails through each of them to a local SMTP sink. The sink
+waits --data-delay seconds before accepting each message to simulate a remote relay.
+
+Usage:
+    python -m benchmarks.delivery_engines --messages 10000 --data-delay 0.05
+"""
+
+import argparse
+import time
+
+from app import create_app
+from app.delivery.engines import asyncio_engine, threaded_engine
+from app.email import smtp_pool
+from benchmarks import BenchmarkConfig
+from benchmarks.smtp_sink import SMTPSink
+
+
+def run(label, engine, app, messages, batch_size, sink):
+    connections = sink.connections
+    start = time.perf_counter()
+    sent = 0
+
+    while sent < messages:
+        limit = engine.wait_for_capacity(min(batch_size, messages - sent))
+        futures = [
+            engine.submit(
+                app=app,
+                subject="Happy Birthday!",
+                sender="sender@example.com",
+                recipients=[f"recipient{sent + number}@example.com"],
+                text_body="Happy Birthday!",
+                html_body="<p>Happy Birthday!</p>",
+            )
+            for number in range(limit)
+        ]
+        for future in futures:
+            future.result()
+        sent += limit
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<10} {messages:7d} messages {elapsed:8.2f} s "
+        f"{messages / elapsed:10.1f} messages/s "
+        f"{sink.connections - connections:6d} connections"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--data-delay", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    sink = SMTPSink(data_delay=args.data_delay).start()
+    BenchmarkConfig.MAIL_PORT = sink.port
+    app = create_app(BenchmarkConfig)
+
+    with app.app_context():
+        run("threaded", threaded_engine, app, args.messages, args.batch_size, sink)
+        run("asyncio", asyncio_engine, app, args.messages, args.batch_size, sink)
+        smtp_pool.close()
+        asyncio_engine.stop()
+
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
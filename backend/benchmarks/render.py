@@ -0,0 +1,90 @@
+"""
+render.py
+
+This file benchmarks the rendering of occasion emails: render_template for every message,
+the cached templates of the renderer for every message, and the batch rendering used by
+the delivery queue. It prints the render time per message of each.
+
+Usage:
+    python -m benchmarks.render --messages 10000 --batch-size 500
+"""
+
+import argparse
+import time
+from collections import namedtuple
+
+from app import create_app
+from app.rendering import OCCASION_TEMPLATES, renderer
+from benchmarks import BenchmarkConfig
+from flask import render_template
+
+Payload = namedtuple("Payload", ["id", "occasion_type", "message_content", "sender"])
+
+
+def build_payloads(messages):
+    return [
+        Payload(
+            id=number,
+            occasion_type="Happy Birthday!",
+            message_content=f"Happy Birthday, friend number {number}!\n\nSee you soon.",
+            sender="sender@example.com",
+        )
+        for number in range(messages)
+    ]
+
+
+def render_each(render, payloads):
+    for payload in payloads:
+        for name in OCCASION_TEMPLATES:
+            render(
+                name,
+                occasion_type=payload.occasion_type,
+                message_content=payload.message_content,
+                sender=payload.sender,
+            )
+
+
+def render_batches(payloads, batch_size):
+    for start in range(0, len(payloads), batch_size):
+        renderer.render_occasions(payloads[start : start + batch_size])
+
+
+def run(label, render, messages):
+    start = time.perf_counter()
+    render()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<20} {elapsed / messages * 1e6:10.1f} us/message")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    payloads = build_payloads(args.messages)
+
+    with app.app_context():
+        # Compile the templates before timing
+        render_batches(payloads[:1], 1)
+
+        run(
+            "render_template",
+            lambda: render_each(render_template, payloads),
+            args.messages,
+        )
+        run(
+            "cached templates",
+            lambda: render_each(renderer.render, payloads),
+            args.messages,
+        )
+        run(
+            "batch rendering",
+            lambda: render_batches(payloads, args.batch_size),
+            args.messages,
+        )
+
+
+if __name__ == "__main__":
+    main()
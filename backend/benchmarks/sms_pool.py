@@ -0,0 +1,59 @@
+"""
+sms_pool.py
+
+This file benchmarks the Twilio provider over pooled keep-alive connections against one
+connection per text, by sending texts in batches to a local SMS sink.
+
+Usage:
+    python -m benchmarks.sms_pool --messages 1000 --connect-delay 0.01
+"""
+
+import argparse
+import time
+
+from app.sms import SMS, TwilioProvider
+from benchmarks.sms_sink import SMSSink
+
+
+def run(label, provider, messages, batch_size, sink):
+    connections = sink.connections
+    texts = [SMS(f"+1555{number:07d}", "Happy Birthday!") for number in range(messages)]
+    start = time.perf_counter()
+
+    for first in range(0, messages, batch_size):
+        provider.send_batch(texts[first : first + batch_size])
+        # Without a pool, every text pays for a new connection
+        if batch_size == 1:
+            provider.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<24} {messages / elapsed:10.1f} texts/s "
+        f"{sink.connections - connections:6d} connections"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--connect-delay",
+        type=float,
+        default=0.0,
+        help="Seconds the sink waits per connection to simulate the TLS handshake.",
+    )
+    args = parser.parse_args()
+
+    sink = SMSSink(connect_delay=args.connect_delay).start()
+    provider = TwilioProvider("AC0", "token", "+15550000000", sink.url, 1, 10)
+
+    run("connection per text", provider, args.messages, 1, sink)
+    run("pooled connections", provider, args.messages, args.batch_size, sink)
+    provider.close()
+
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
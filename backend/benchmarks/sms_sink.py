@@ -0,0 +1,109 @@
+"""
+sms_sink.py
+
+This file contains a local SMS sink: a minimal threaded HTTP server answering like the
+Messages resource of the Twilio REST API and throwing the texts away. It is used by the
+benchmarks and the tests as a stand-in for the SMS provider.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class SMSSinkHandler(BaseHTTPRequestHandler):
+    """Accept texts posted to /2010-04-01/Accounts/<sid>/Messages.json."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't let them wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+
+        # Simulate the cost of the TLS handshake of the real API
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+
+        super().handle()
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+
+        if not self.path.endswith("/Messages.json") or "To" not in form:
+            self.reply(
+                400, {"code": 21604, "message": "A 'To' phone number is required."}
+            )
+            return
+
+        # Simulate the time the API takes to accept a text
+        if server.request_delay:
+            time.sleep(server.request_delay)
+
+        with server.lock:
+            server.messages += 1
+            sid = f"SM{server.messages:032d}"
+
+        # Simulate a connection lost after the text was accepted
+        if form["To"][0] in server.drop:
+            self.close_connection = True
+            return
+
+        self.reply(201, {"sid": sid, "to": form["To"][0], "status": "queued"})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SMSSink(ThreadingHTTPServer):
+    """
+    Local HTTP server counting the connections and texts it receives.
+
+    Attributes:
+    - connect_delay: Seconds each new connection waits before its first request is read.
+    - request_delay: Seconds each text waits before it is accepted.
+    - drop: Phone numbers whose texts are accepted without a response, closing the connection.
+    - connections: Number of connections accepted.
+    - messages: Number of texts accepted.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, connect_delay=0, request_delay=0):
+        super().__init__((host, port), SMSSinkHandler)
+        self.connect_delay = connect_delay
+        self.request_delay = request_delay
+        self.connections = 0
+        self.messages = 0
+        self.drop = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        """Serve in a background thread."""
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
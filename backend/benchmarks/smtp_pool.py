@@ -0,0 +1,71 @@
+"""
+smtp_pool.py
+
+This file benchmarks the pooled SMTP transport against one connection per email, the way
+mail.send() sends, by sending messages to a local SMTP sink.
+
+Usage:
+    python -m benchmarks.smtp_pool --messages 1000 --connect-delay 0.01
+"""
+
+import argparse
+import time
+
+from app import create_app, mail
+from app.email import smtp_pool
+from benchmarks import BenchmarkConfig
+from benchmarks.smtp_sink import SMTPSink
+from flask_mail import Message
+
+
+def build_message(number):
+    msg = Message(
+        subject="Happy Birthday!",
+        sender="sender@example.com",
+        recipients=[f"recipient{number}@example.com"],
+    )
+    msg.body = "Happy Birthday!"
+    msg.html = "<p>Happy Birthday!</p>"
+    return msg
+
+
+def run(label, send, messages, sink):
+    connections = sink.connections
+    start = time.perf_counter()
+
+    for number in range(messages):
+        send(build_message(number))
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<24} {messages / elapsed:10.1f} messages/s "
+        f"{sink.connections - connections:6d} connections"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument(
+        "--connect-delay",
+        type=float,
+        default=0.0,
+        help="Seconds the sink waits per connection to simulate TLS and AUTH.",
+    )
+    args = parser.parse_args()
+
+    sink = SMTPSink(connect_delay=args.connect_delay).start()
+    BenchmarkConfig.MAIL_PORT = sink.port
+    BenchmarkConfig.MAIL_POOL_SIZE = 1
+    app = create_app(BenchmarkConfig)
+
+    with app.app_context():
+        run("connection per message", mail.send, args.messages, sink)
+        run("pooled connections", smtp_pool.send, args.messages, sink)
+        smtp_pool.close()
+
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
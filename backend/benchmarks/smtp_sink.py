@@ -0,0 +1,97 @@
+"""
+smtp_sink.py
+
+This file contains a local SMTP sink: a minimal threaded SMTP server that accepts every
+message and throws it away. It is used by the benchmarks and the tests as a stand-in for
+the real mail relay.
+"""
+
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speak just enough SMTP to accept messages from smtplib and aiosmtplib."""
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+
+        # Simulate the cost of the TLS handshake and AUTH exchange of a real relay
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+
+        self.reply("220 localhost SMTP sink ready")
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command = line.decode("utf-8", "replace").strip().upper()
+
+            if command.startswith("EHLO"):
+                self.reply("250-localhost", "250-PIPELINING", "250 8BITMIME")
+            elif command.startswith("HELO"):
+                self.reply("250 localhost")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                # Simulate the time a real relay takes to accept a message
+                if server.data_delay:
+                    time.sleep(server.data_delay)
+                with server.lock:
+                    server.messages += 1
+                self.reply("250 OK queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def reply(self, *lines):
+        self.wfile.write("".join(f"{line}\r\n" for line in lines).encode())
+        self.wfile.flush()
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server counting the connections and messages it receives.
+
+    Attributes:
+    - connect_delay: Seconds each new connection waits before the greeting.
+    - data_delay: Seconds each message waits before it is accepted.
+    - connections: Number of connections accepted.
+    - messages: Number of messages accepted.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, connect_delay=0, data_delay=0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.connect_delay = connect_delay
+        self.data_delay = data_delay
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve in a background thread."""
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
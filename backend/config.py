@@ -5,6 +5,7 @@ This file defines the configuration settings for the Flask application.
 It includes settings such as database URI, mail server details, API documentation settings, etc.
 """
 
+import json
 import os
 
 from dotenv import load_dotenv
@@ -20,6 +21,10 @@ class Config:
     Key Configurations:
     - SQLALCHEMY_TRACK_MODIFICATIONS: Disable modification tracking for SQLAlchemy to improve performance.
     - SCHEDULER_API_ENABLED: Enable the scheduler API.
+    - SCHEDULER_AUTOSTART: Start the background scheduler when the application is created.
+    - SCHEDULER_LEADER_ELECTION: Only run the scheduler in the process holding the leader lock.
+    - SCHEDULER_LEADER_LOCK_ID: Key of the Postgres advisory lock used for the leader election.
+    - SCHEDULER_LEADER_POLL_INTERVAL: Seconds between two leader election rounds.
     - SECRET_KEY: Secret key for session management and CSRF protection.
     - SQLALCHEMY_DATABASE_URI: Database URI for SQLAlchemy.
     - MAIL_SERVER: Mail server for sending email notifications.
@@ -27,14 +32,70 @@ class Config:
     - MAIL_USE_TLS: Enable TLS for email communication.
     - MAIL_USERNAME: Username for the mail server.
     - MAIL_PASSWORD: Password for the mail server.
+    - MAIL_RATE_LIMIT: Emails per minute accepted by the mail provider, 0 for no limit.
+    - MAIL_RATE_BURST: Emails the mail provider accepts at once before MAIL_RATE_LIMIT applies.
+    - MAIL_SENDER_RATE_LIMIT: Emails per minute accepted per sender address, 0 for no limit.
+    - MAIL_SENDER_RATE_BURST: Emails a sender can send at once before MAIL_SENDER_RATE_LIMIT applies.
+    - MAIL_TRANSACTIONAL_RATE_LIMIT: Transactional emails per minute, 0 for no limit, instead of the limits above.
+    - MAIL_TRANSACTIONAL_RATE_BURST: Transactional emails sent at once before MAIL_TRANSACTIONAL_RATE_LIMIT applies.
+    - MAIL_TRANSACTIONAL_QUEUE_TIMEOUT: Seconds a request waits for room to queue a transactional email before a 503.
+    - MAIL_POOL_SIZE: Maximum number of SMTP connections kept open per process.
+    - MAIL_POOL_RESERVED: Number of the pooled SMTP connections reserved for transactional emails.
+    - MAIL_POOL_MAX_MESSAGES: Number of emails sent over an SMTP connection before it is replaced.
+    - MAIL_POOL_IDLE_TIMEOUT: Seconds an SMTP connection may stay idle before it is considered stale.
+    - SMS_PROVIDER: Provider sending the SMS deliveries, "twilio", "fake" to keep them in memory, or empty to disable them.
+    - SMS_BATCH_SIZE: Maximum number of texts handed to the SMS provider at once.
+    - SMS_POOL_SIZE: Maximum number of HTTP connections to the SMS provider kept open per process.
+    - SMS_TIMEOUT: Seconds to wait for the SMS provider before giving up a request.
+    - TWILIO_ACCOUNT_SID: Twilio account SID.
+    - TWILIO_AUTH_TOKEN: Twilio auth token.
+    - TWILIO_FROM_NUMBER: Twilio phone number the texts are sent from.
+    - TWILIO_API_URL: Base URL of the Twilio REST API.
     - ADMINS: List of administrators' email addresses.
+    - API_PAGE_SIZE: Number of items of a page of the paginated API routes when no limit is given.
+    - API_MAX_PAGE_SIZE: Maximum number of items of a page of the paginated API routes.
+    - API_EXPORT_CHUNK_SIZE: Number of rows read from the database and written at once by the export routes.
     - SWAGGER: Configuration for Swagger API documentation.
+    - DELIVERY_SCAN_INTERVAL: Seconds between two scans of the occasions table for due deliveries.
+    - DELIVERY_BATCH_SIZE: Maximum number of occasions loaded and delivered per batch.
+    - DELIVERY_MISFIRE_GRACE_TIME: Seconds after its date and time during which an occasion is still delivered.
+    - DELIVERY_OUTBOX_INTERVAL: Seconds between two runs of the relay applying the delivery outbox.
+    - DELIVERY_OUTBOX_BATCH_SIZE: Maximum number of outbox entries applied per transaction.
+    - DELIVERY_PLAN_INTERVAL: Seconds between two runs of the planner spreading clusters of occasions.
+    - DELIVERY_PLAN_HORIZON: Seconds ahead the planner looks for clusters, should exceed DELIVERY_PLAN_INTERVAL.
+    - DELIVERY_PLAN_CLUSTER_SIZE: Number of occasions due at the same instant the planner spreads.
+    - DELIVERY_PLAN_WINDOW: Seconds a cluster of occasions is spread over.
+    - DELIVERY_PLAN_EARLY_START: Seconds of the window taken before the instant of a cluster.
+    - DELIVERY_RECONCILE_MAX_AGE: Seconds in the past within which missed deliveries are replayed at startup.
+    - DELIVERY_RECONCILE_RATE: Maximum number of missed deliveries replayed per second.
+    - DELIVERY_MAX_ATTEMPTS: Number of failed attempts after which a delivery moves to the dead letters.
+    - DELIVERY_RETRY_BACKOFF: Seconds before retrying a delivery after its first failed attempt, doubled after each attempt.
+    - DELIVERY_RETRY_BACKOFF_MAX: Maximum number of seconds before retrying a failed delivery.
+    - DELIVERY_HISTORY_FLUSH_SIZE: Number of buffered delivery statuses written with one insert.
+    - DELIVERY_HISTORY_FLUSH_INTERVAL: Milliseconds after which buffered delivery statuses are written.
+    - DELIVERY_MAX_WORKERS: Maximum number of emails sent concurrently per process, across all lanes.
+    - DELIVERY_LANES: Priority lanes of the delivery executor with their weight, max_workers and queue_size, as JSON.
+    - DELIVERY_QUEUE_SIZE: Maximum number of claimed deliveries waiting for the asyncio engine.
+    - DELIVERY_MIME_CACHE: Whether the MIME messages of occasions are built when they are written instead of at send time.
+    - DELIVERY_COALESCE: Whether emails due to the same recipient at about the same time are combined into one.
+    - DELIVERY_COALESCE_WINDOW: Seconds of the time buckets in which emails to the same recipient are combined.
+    - DELIVERY_ENGINE: Engine sending the deliveries, "threaded" or "asyncio" for high-fanout dates.
+    - DELIVERY_ASYNC_CONCURRENCY: Maximum number of SMTP conversations in flight with the asyncio engine.
+    - JOBS: Background jobs registered with the scheduler.
 
     Please set the required environment variables in the .env file for certain configurations.
     """
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SCHEDULER_API_ENABLED = True
+    SCHEDULER_AUTOSTART = True
+    SCHEDULER_LEADER_ELECTION = True
+    SCHEDULER_LEADER_LOCK_ID = int(
+        os.environ.get("SCHEDULER_LEADER_LOCK_ID", 7_110_551_347)
+    )
+    SCHEDULER_LEADER_POLL_INTERVAL = int(
+        os.environ.get("SCHEDULER_LEADER_POLL_INTERVAL", 15)
+    )
     SECRET_KEY = os.environ.get("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URI")
     MAIL_SERVER = os.environ.get("MAIL_SERVER")
@@ -42,7 +103,35 @@ class Config:
     MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS")
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
+    MAIL_RATE_LIMIT = int(os.environ.get("MAIL_RATE_LIMIT", 0))
+    MAIL_RATE_BURST = int(os.environ.get("MAIL_RATE_BURST", 10))
+    MAIL_SENDER_RATE_LIMIT = int(os.environ.get("MAIL_SENDER_RATE_LIMIT", 0))
+    MAIL_SENDER_RATE_BURST = int(os.environ.get("MAIL_SENDER_RATE_BURST", 10))
+    MAIL_TRANSACTIONAL_RATE_LIMIT = int(
+        os.environ.get("MAIL_TRANSACTIONAL_RATE_LIMIT", 0)
+    )
+    MAIL_TRANSACTIONAL_RATE_BURST = int(
+        os.environ.get("MAIL_TRANSACTIONAL_RATE_BURST", 10)
+    )
+    MAIL_TRANSACTIONAL_QUEUE_TIMEOUT = int(
+        os.environ.get("MAIL_TRANSACTIONAL_QUEUE_TIMEOUT", 1)
+    )
+    MAIL_POOL_SIZE = int(os.environ.get("MAIL_POOL_SIZE", 8))
+    MAIL_POOL_RESERVED = int(os.environ.get("MAIL_POOL_RESERVED", 1))
+    MAIL_POOL_MAX_MESSAGES = int(os.environ.get("MAIL_POOL_MAX_MESSAGES", 100))
+    MAIL_POOL_IDLE_TIMEOUT = int(os.environ.get("MAIL_POOL_IDLE_TIMEOUT", 60))
+    SMS_PROVIDER = os.environ.get("SMS_PROVIDER", "")
+    SMS_BATCH_SIZE = int(os.environ.get("SMS_BATCH_SIZE", 50))
+    SMS_POOL_SIZE = int(os.environ.get("SMS_POOL_SIZE", 4))
+    SMS_TIMEOUT = int(os.environ.get("SMS_TIMEOUT", 10))
+    TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
+    TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
+    TWILIO_FROM_NUMBER = os.environ.get("TWILIO_FROM_NUMBER")
+    TWILIO_API_URL = os.environ.get("TWILIO_API_URL", "https://api.twilio.com")
     ADMINS = ["bcdipeshwork@gmail.com"]
+    API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 50))
+    API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 500))
+    API_EXPORT_CHUNK_SIZE = int(os.environ.get("API_EXPORT_CHUNK_SIZE", 1000))
     SWAGGER = {
         "title": "Memorable Messages REST API",
         "description": "Welcome to the Memorable Messages Web Application API documentation. This application empowers users to create heartfelt messages for their loved ones, friends, and family on special occasions. Users can sign up, log in, and craft personalized messages based on occasions, setting delivery dates and times. Additionally, users can choose to have their messages sent every year on the same date and time, creating a lasting tradition.\n\nKey Features:\n- User Authentication: Securely sign up and log in to access personalized message creation.\n- Occasion-Based Messages: Craft messages tailored to specific occasions such as birthdays, anniversaries, and more.\n- Scheduled Delivery: Set delivery dates and times for messages, with an option to repeat yearly.\n- Multi-Channel Delivery: Choose between SMS and email as the preferred method of message delivery.\n- External API Integration: Utilize Twilio for SMS delivery and Google API for email delivery.\n\nExplore the API and discover how the Memorable Messages Web Application can enhance your user's ability to create and share meaningful messages.",
@@ -54,3 +143,86 @@ class Config:
         "headers": [],
         "specs_route": "/api-docs",
     }
+    DELIVERY_SCAN_INTERVAL = int(os.environ.get("DELIVERY_SCAN_INTERVAL", 30))
+    DELIVERY_BATCH_SIZE = int(os.environ.get("DELIVERY_BATCH_SIZE", 500))
+    DELIVERY_MISFIRE_GRACE_TIME = int(
+        os.environ.get("DELIVERY_MISFIRE_GRACE_TIME", 86400)
+    )
+    DELIVERY_OUTBOX_INTERVAL = int(os.environ.get("DELIVERY_OUTBOX_INTERVAL", 5))
+    DELIVERY_OUTBOX_BATCH_SIZE = int(os.environ.get("DELIVERY_OUTBOX_BATCH_SIZE", 500))
+    DELIVERY_PLAN_INTERVAL = int(os.environ.get("DELIVERY_PLAN_INTERVAL", 300))
+    DELIVERY_PLAN_HORIZON = int(os.environ.get("DELIVERY_PLAN_HORIZON", 3600))
+    DELIVERY_PLAN_CLUSTER_SIZE = int(os.environ.get("DELIVERY_PLAN_CLUSTER_SIZE", 500))
+    DELIVERY_PLAN_WINDOW = int(os.environ.get("DELIVERY_PLAN_WINDOW", 600))
+    DELIVERY_PLAN_EARLY_START = int(os.environ.get("DELIVERY_PLAN_EARLY_START", 0))
+    DELIVERY_RECONCILE_MAX_AGE = int(
+        os.environ.get("DELIVERY_RECONCILE_MAX_AGE", 7 * 86400)
+    )
+    DELIVERY_RECONCILE_RATE = int(os.environ.get("DELIVERY_RECONCILE_RATE", 50))
+    DELIVERY_MAX_ATTEMPTS = int(os.environ.get("DELIVERY_MAX_ATTEMPTS", 5))
+    DELIVERY_RETRY_BACKOFF = int(os.environ.get("DELIVERY_RETRY_BACKOFF", 60))
+    DELIVERY_RETRY_BACKOFF_MAX = int(os.environ.get("DELIVERY_RETRY_BACKOFF_MAX", 3600))
+    DELIVERY_HISTORY_FLUSH_SIZE = int(
+        os.environ.get("DELIVERY_HISTORY_FLUSH_SIZE", 1000)
+    )
+    DELIVERY_HISTORY_FLUSH_INTERVAL = int(
+        os.environ.get("DELIVERY_HISTORY_FLUSH_INTERVAL", 500)
+    )
+    DELIVERY_MAX_WORKERS = int(os.environ.get("DELIVERY_MAX_WORKERS", 10))
+    DELIVERY_LANES = json.loads(
+        os.environ.get(
+            "DELIVERY_LANES",
+            json.dumps(
+                {
+                    "transactional": {"weight": 8, "max_workers": 2, "queue_size": 100},
+                    "scheduled": {"weight": 4, "max_workers": 6, "queue_size": 64},
+                    "replay": {"weight": 1, "max_workers": 2, "queue_size": 16},
+                }
+            ),
+        )
+    )
+    DELIVERY_QUEUE_SIZE = int(os.environ.get("DELIVERY_QUEUE_SIZE", 64))
+    DELIVERY_MIME_CACHE = (
+        os.environ.get("DELIVERY_MIME_CACHE", "false").lower() == "true"
+    )
+    DELIVERY_COALESCE = os.environ.get("DELIVERY_COALESCE", "false").lower() == "true"
+    DELIVERY_COALESCE_WINDOW = int(os.environ.get("DELIVERY_COALESCE_WINDOW", 60))
+    DELIVERY_ENGINE = os.environ.get("DELIVERY_ENGINE", "threaded")
+    DELIVERY_ASYNC_CONCURRENCY = int(os.environ.get("DELIVERY_ASYNC_CONCURRENCY", 200))
+    JOBS = [
+        {
+            "id": "deliver-due-occasions",
+            "func": "app.delivery.queue:deliver_due_occasions",
+            "trigger": "interval",
+            "seconds": DELIVERY_SCAN_INTERVAL,
+            "max_instances": 1,
+            "coalesce": True,
+            "replace_existing": True,
+        },
+        {
+            "id": "relay-delivery-outbox",
+            "func": "app.delivery.outbox:relay_outbox",
+            "trigger": "interval",
+            "seconds": DELIVERY_OUTBOX_INTERVAL,
+            "max_instances": 1,
+            "coalesce": True,
+            "replace_existing": True,
+        },
+        {
+            "id": "plan-delivery-clusters",
+            "func": "app.delivery.planner:plan_delivery_clusters",
+            "trigger": "interval",
+            "seconds": DELIVERY_PLAN_INTERVAL,
+            "max_instances": 1,
+            "coalesce": True,
+            "replace_existing": True,
+        },
+        {
+            # Runs once, as soon as the scheduler starts in the elected leader
+            "id": "reconcile-missed-deliveries",
+            "func": "app.delivery.reconcile:reconcile_missed_occasions",
+            "trigger": "date",
+            "misfire_grace_time": None,
+            "replace_existing": True,
+        },
+    ]